@@ -1,17 +1,67 @@
+import csv
+import hashlib
+import io
+import json
 import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from flask import Flask, request, render_template, flash, redirect, url_for
+from functools import wraps
+from flask import Flask, Response, abort, request, render_template, flash, redirect, url_for
 from werkzeug.utils import secure_filename
 
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+    pa_csv = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    from openpyxl import Workbook, load_workbook
+except ImportError:
+    Workbook = None
+    load_workbook = None
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-in-production'
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
-ALLOWED_EXTENSIONS = {'csv'}
+ALLOWED_EXTENSIONS = {'csv', 'xlsx'}
+DRILLDOWN_FOLDER = os.path.join(UPLOAD_FOLDER, '.drilldown')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# CSV ingestion backend: 'c' (pandas default) or 'pyarrow' (multithreaded Arrow reader).
+# Without pyarrow installed, 'pyarrow' falls back to the C engine with a warning in the log.
+app.config['CSV_ENGINE'] = os.environ.get('CSV_ENGINE', 'c')
+# When set, every pyarrow read is also parsed with the C engine and compared
+app.config['CSV_ENGINE_VERIFY'] = os.environ.get('CSV_ENGINE_VERIFY', '').lower() in ('1', 'true', 'yes')
+# Admission control: uploads of at least HEAVY_UPLOAD_MB wait for a limited number of parse slots
+app.config['HEAVY_UPLOAD_BYTES'] = int(float(os.environ.get('HEAVY_UPLOAD_MB', '2')) * 1024 * 1024)
+app.config['MAX_HEAVY_PARSES_PER_WORKER'] = int(os.environ.get('MAX_HEAVY_PARSES_PER_WORKER', '1'))
+app.config['MAX_HEAVY_PARSES_PER_HOST'] = int(os.environ.get('MAX_HEAVY_PARSES_PER_HOST', str(os.cpu_count() or 1)))
+app.config['MAX_QUEUED_HEAVY_UPLOADS'] = int(os.environ.get('MAX_QUEUED_HEAVY_UPLOADS', '4'))
+app.config['ADMISSION_WAIT_SECONDS'] = float(os.environ.get('ADMISSION_WAIT_SECONDS', '10'))  # Keep below the gunicorn timeout
+app.config['ADMISSION_RETRY_AFTER_SECONDS'] = int(os.environ.get('ADMISSION_RETRY_AFTER_SECONDS', '15'))
+# Where the watch-folder ingest service (ingest_daemon.py) keeps its manifest and aggregates
+app.config['INGEST_STORE_DIR'] = os.environ.get('INGEST_STORE_DIR', 'ingested')
+# Threads used to parse the files of one upload field in parallel
+app.config['PARSE_WORKERS'] = int(os.environ.get('PARSE_WORKERS', str(min(4, os.cpu_count() or 1))))
+# How long the drill-down index of an upload is kept after the report is shown
+app.config['DRILLDOWN_MAX_AGE_SECONDS'] = int(os.environ.get('DRILLDOWN_MAX_AGE_SECONDS', '3600'))
 
 # Create upload directory if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -167,138 +217,1302 @@ def parse_report_date(time_str):
     except:
         return None
 
-def process_offline_csv(file_path, view_type='hourly', operating_start_hour=0):
-    """Process offline CSV file according to filtering rules"""
+# Values the pandas C engine reads as missing, passed to the Arrow reader so both agree
+CSV_NULL_VALUES = [
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+]
+
+# Rows of an XLSX sheet converted to a frame at a time; the sheet itself is streamed
+XLSX_CHUNK_ROWS = 50000
+
+def is_xlsx(file_path):
+    return file_path.lower().endswith('.xlsx')
+
+def xlsx_cell_text(value):
+    """Text of an XLSX cell as a CSV export of the sheet would hold it"""
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, datetime):
+        # Excel stores times as fractions of a day; drop the float noise below a second
+        if value.microsecond:
+            value = (value + timedelta(microseconds=500000)).replace(microsecond=0)
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()  # date or time of day
+    return str(value)
+
+def xlsx_rows(file_path):
+    """Stream the first worksheet of an XLSX file row by row (tuples of cell values, header first)"""
+    if load_workbook is None:
+        raise Exception("XLSX files require the openpyxl package")
+    # read_only parses the sheet XML lazily instead of building every cell in memory
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
     try:
-        df = pd.read_csv(file_path)
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+def xlsx_usecols(columns, kind=None):
+    """Positions of the columns the processor of kind reads (every column when kind is None)"""
+    if kind in TRANSACTION_HEADER_COLUMNS:
+        wanted = {header_key(col) for col in TRANSACTION_HEADER_COLUMNS[kind] + DEDUP_ID_COLUMNS[kind]}
+        return [i for i, col in enumerate(columns) if header_key(col) in wanted]
+    if kind == 'report' and columns:
+        return sorted({columns.index(col) for col in detect_report_columns(columns)})
+    if kind == 'report_products':
+        return [i for i, col in enumerate(columns) if col in CSV_SCHEMAS['report_products']['required']]
+    return list(range(len(columns)))
+
+def iter_xlsx_chunks(file_path, chunksize, kind=None, nrows=None):
+    """
+    Yield the first sheet of an XLSX file as frames of up to chunksize rows.
 
-        # Debug: Print column names and sample data
-        print(f"Offline CSV columns: {list(df.columns)}")
-        print(f"Sample Transaction Type values: {df['Transaction Type'].unique()[:5]}")
-        print(f"Sample Is_Cancelled values: {df['Is_Cancelled'].unique()[:5]}")
+    Only the columns kind needs are kept. Each chunk is written out as CSV text
+    and read back with pd.read_csv, so values get exactly the dtypes, booleans
+    and missing values of the CSV path. Frames are indexed by row offset
+    (sheet row - 2), like CSV chunks; blank rows are skipped. At most one
+    chunk of raw rows is held at a time.
+    """
+    rows = xlsx_rows(file_path)
+    try:
+        header = next(rows, None)
+        if header is None:
+            raise pd.errors.EmptyDataError("No columns to parse from file")
+        # Formatted but empty cells can extend the sheet past the last real column
+        header = list(header)
+        while header and header[-1] is None:
+            header.pop()
+        # Let pandas name blank and duplicate headers the way it does for a CSV
+        header_line = io.StringIO()
+        csv.writer(header_line).writerow([xlsx_cell_text(value) for value in header])
+        header_line.seek(0)
+        columns = list(pd.read_csv(header_line, nrows=0).columns)
+        positions = xlsx_usecols(columns, kind)
+        names = [columns[i] for i in positions]
+
+        def to_frame(buffer, index):
+            buffer.seek(0)
+            if not index:
+                return pd.DataFrame(columns=names)
+            df = pd.read_csv(buffer, header=None, names=names)
+            df.index = pd.Index(index)
+            return df
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        index = []
+        chunks = 0
+        for offset, row in enumerate(rows):
+            if nrows is not None and offset >= nrows:
+                break
+            values = [xlsx_cell_text(row[i]) if i < len(row) else '' for i in positions]
+            if not any(values):
+                continue
+            writer.writerow(values)
+            index.append(offset)
+            if len(index) == chunksize:
+                yield to_frame(buffer, index)
+                chunks += 1
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                index = []
+        # Always yield at least one (possibly empty) frame so callers get the columns
+        if index or chunks == 0:
+            yield to_frame(buffer, index)
+    finally:
+        rows.close()
+
+def read_xlsx_file(file_path, kind=None, nrows=None):
+    """Read an XLSX file into one frame, XLSX_CHUNK_ROWS rows at a time"""
+    chunks = list(iter_xlsx_chunks(file_path, XLSX_CHUNK_ROWS, kind, nrows))
+    return pd.concat(chunks) if len(chunks) > 1 else chunks[0]
+
+def read_file_sample(file_path, nrows):
+    """First nrows rows of a CSV or XLSX file, or just its columns with nrows=0"""
+    if is_xlsx(file_path):
+        return read_xlsx_file(file_path, nrows=nrows)
+    return pd.read_csv(file_path, nrows=nrows)
+
+def read_csv_arrow_table(file_path):
+    """
+    Read a CSV into an Arrow table with the multithreaded Arrow reader.
 
-        # Handle string boolean values for Is_Cancelled
-        df['Is_Cancelled_Bool'] = df['Is_Cancelled'].astype(str).str.upper().isin(['TRUE', 'T', '1', 'YES'])
+    Options mirror the pandas C engine: the same null and boolean spellings, and
+    columns named like a time/date are kept as text so every timestamp still
+    goes through parse_time_to_hour/parse_time_to_date. Raises ValueError for
+    inputs whose pandas conversion would differ from the C engine.
+    """
+    header = pd.read_csv(file_path, nrows=0).columns
+    text_columns = {col: pa.string() for col in header if 'time' in col.lower() or 'date' in col.lower()}
+
+    table = pa_csv.read_csv(
+        file_path,
+        read_options=pa_csv.ReadOptions(use_threads=True),
+        convert_options=pa_csv.ConvertOptions(
+            column_types=text_columns,
+            null_values=CSV_NULL_VALUES,
+            strings_can_be_null=True,
+            quoted_strings_can_be_null=True,
+            true_values=['True', 'TRUE', 'true'],
+            false_values=['False', 'FALSE', 'false'],
+        ),
+    )
+
+    # Blank or duplicate header names are renamed by the C engine, not by Arrow
+    names = table.column_names
+    if list(names) != list(header) or len(set(names)) != len(names):
+        raise ValueError("header needs pandas column renaming")
+    for field in table.schema:
+        if pa.types.is_timestamp(field.type) or pa.types.is_date(field.type) or pa.types.is_time(field.type):
+            raise ValueError(f"column '{field.name}' was inferred as a temporal type")
+
+    return table
+
+def arrow_table_to_pandas(table, offset=0):
+    """Convert (a slice of) an Arrow table to a numpy-backed frame indexed by file row offset"""
+    df = table.to_pandas()
+    df.index = pd.RangeIndex(offset, offset + len(df))
+    # Arrow returns None for missing text, the C engine returns NaN
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+def read_csv_file(file_path, engine=None, kind=None):
+    """
+    Read a whole CSV with the configured engine.
 
-        # Filter: Transaction Type = Sale and Is_Cancelled = False
-        filtered_df = df[
-            (df['Transaction Type'].str.strip().str.lower() == 'sale') &
-            (df['Is_Cancelled_Bool'] == False)
-        ].copy()
+    The pyarrow engine falls back to the C engine when pyarrow is missing or
+    the input is not supported, so the result is always a pandas DataFrame.
+    XLSX files are streamed instead, keeping only the columns of kind.
+    """
+    if is_xlsx(file_path):
+        return read_xlsx_file(file_path, kind)
+    engine = engine or app.config['CSV_ENGINE']
+    if engine != 'pyarrow':
+        return pd.read_csv(file_path)
 
-        print(f"Filtered offline rows: {len(filtered_df)} out of {len(df)}")
+    if pa_csv is None:
+        print("⚠️ pyarrow is not installed - falling back to the C engine")
+        return pd.read_csv(file_path)
 
-        if len(filtered_df) == 0:
-            if view_type == 'daily':
-                return pd.Series(dtype=float)  # Empty series for daily view
-            else:
-                return pd.Series(0.0, index=range(24))  # Empty hourly series
+    try:
+        df = arrow_table_to_pandas(read_csv_arrow_table(file_path))
+    except (pa.ArrowException, ValueError) as e:
+        print(f"⚠️ pyarrow engine cannot read {file_path} ({str(e)}) - falling back to the C engine")
+        return pd.read_csv(file_path)
 
-        if view_type == 'daily':
-            # Extract business date from Time column using operating hours
-            filtered_df['Date'] = filtered_df['Time'].apply(lambda x: parse_time_to_date(x, operating_start_hour))
+    if app.config['CSV_ENGINE_VERIFY']:
+        problems = compare_csv_engines(file_path, arrow_df=df)
+        if problems:
+            print(f"❌ pyarrow engine differs from the C engine on {file_path}: {problems} - using the C engine result")
+            return pd.read_csv(file_path)
 
-            # Remove rows where date parsing failed
-            filtered_df = filtered_df.dropna(subset=['Date'])
+    return df
 
-            print(f"Offline rows after date parsing: {len(filtered_df)}")
+def iter_csv_chunks(file_path, chunksize, engine=None, kind=None):
+    """
+    Yield a CSV in chunks of chunksize rows, indexed by row offset in the file.
 
-            # Group by date and sum Total column
-            daily_totals = filtered_df.groupby('Date')['Total'].sum()
-            return daily_totals
-        else:
-            # Extract hour from Time column
-            filtered_df['Hour'] = filtered_df['Time'].apply(parse_time_to_hour)
+    With the pyarrow engine the file is parsed in parallel once and each slice
+    of the Arrow table is converted to pandas only when it is consumed. With
+    CSV_ENGINE_VERIFY the whole table is first checked against the C engine,
+    as in read_csv_file.
+    XLSX files are streamed row by row, keeping only the columns of kind.
+    """
+    if is_xlsx(file_path):
+        yield from iter_xlsx_chunks(file_path, chunksize, kind)
+        return
+    engine = engine or app.config['CSV_ENGINE']
+    table = None
+    if engine == 'pyarrow' and pa_csv is not None:
+        try:
+            table = read_csv_arrow_table(file_path)
+        except (pa.ArrowException, ValueError) as e:
+            print(f"⚠️ pyarrow engine cannot read {file_path} ({str(e)}) - falling back to the C engine")
 
-            # Remove rows where hour parsing failed
-            filtered_df = filtered_df.dropna(subset=['Hour'])
+    if table is not None and app.config['CSV_ENGINE_VERIFY']:
+        problems = compare_csv_engines(file_path, arrow_df=arrow_table_to_pandas(table))
+        if problems:
+            print(f"❌ pyarrow engine differs from the C engine on {file_path}: {problems} - using the C engine result")
+            table = None
 
-            print(f"Offline rows after time parsing: {len(filtered_df)}")
+    if table is None:
+        yield from pd.read_csv(file_path, chunksize=chunksize)
+        return
 
-            # Group by hour and sum Total column
-            hourly_totals = filtered_df.groupby('Hour')['Total'].sum()
+    for offset in range(0, table.num_rows, chunksize):
+        yield arrow_table_to_pandas(table.slice(offset, chunksize), offset)
 
-            # Create series for all 24 hours (0-23)
-            result = pd.Series(0.0, index=range(24))
-            result.update(hourly_totals)
+def compare_csv_engines(file_path, arrow_df=None):
+    """
+    Compare the pyarrow engine output for a CSV with the C engine.
 
-            return result
+    Returns a list of differences (empty when both engines agree exactly).
+    """
+    if pa_csv is None:
+        return ["pyarrow is not installed"]
 
-    except Exception as e:
-        raise Exception(f"Error processing offline CSV: {str(e)}")
+    c_df = pd.read_csv(file_path)
+    if arrow_df is None:
+        try:
+            arrow_df = arrow_table_to_pandas(read_csv_arrow_table(file_path))
+        except (pa.ArrowException, ValueError) as e:
+            return [f"unsupported by pyarrow engine: {str(e)}"]
 
-def process_online_csv(file_path, view_type='hourly', operating_start_hour=0):
-    """Process online CSV file according to filtering rules"""
+    if list(c_df.columns) != list(arrow_df.columns):
+        return [f"columns differ: {list(c_df.columns)} vs {list(arrow_df.columns)}"]
+
+    problems = []
+    for col in c_df.columns:
+        try:
+            pd.testing.assert_series_equal(c_df[col], arrow_df[col])
+        except AssertionError as e:
+            problems.append(f"column '{col}': {str(e).splitlines()[0]}")
+    return problems
+
+def detect_report_columns(columns):
+    """Identify the datetime and value columns of a sales report CSV"""
+    datetime_col = None
+    value_col = None
+
+    # Look for common datetime column names
+    datetime_candidates = ['datetime', 'date_time', 'time', 'timestamp', 'created_time', 'date', 'date / time']
+    for col in columns:
+        if col.lower().strip() in datetime_candidates or 'time' in col.lower() or 'date' in col.lower():
+            datetime_col = col
+            break
+
+    # Look for common value column names
+    value_candidates = ['total', 'amount', 'value', 'sum', 'revenue', 'total sales', 'sales']
+    for col in columns:
+        col_lower = col.lower().strip()
+        if col_lower in value_candidates or 'total' in col_lower or 'sales' in col_lower:
+            value_col = col
+            break
+
+    # If not found, use the first two columns
+    if datetime_col is None:
+        datetime_col = columns[0]
+    if value_col is None:
+        value_col = columns[1] if len(columns) > 1 else columns[0]
+
+    return datetime_col, value_col
+
+# Columns each processor relies on, checked up front by preflight_csv
+CSV_SCHEMAS = {
+    'online': {
+        'label': 'Online CSV',
+        'required': ['Created Time', 'Status', 'Total'],
+        'timestamps': ['Created Time'],
+        'numeric': ['Total'],
+    },
+    'offline': {
+        'label': 'Offline CSV',
+        'required': ['Time', 'Transaction Type', 'Is_Cancelled', 'Total'],
+        'timestamps': ['Time'],
+        'numeric': ['Total'],
+    },
+    'report': {
+        'label': 'Report CSV',
+        'required': [],  # Columns are auto-detected, see detect_report_columns
+        'timestamps': [],
+        'numeric': [],
+    },
+    'online_products': {
+        'label': 'Online CSV',
+        'required': ['Created Time', 'Status', 'Item', 'Quantity'],
+        'timestamps': ['Created Time'],
+        'numeric': ['Quantity'],
+    },
+    'offline_products': {
+        'label': 'Offline CSV',
+        'required': ['Time', 'Transaction Type', 'Is_Cancelled', 'Item', 'Quantity'],
+        'timestamps': ['Time'],
+        'numeric': ['Quantity'],
+    },
+    'online_all': {
+        'label': 'Online CSV',
+        'required': ['Created Time', 'Status', 'Total', 'Item', 'Quantity'],
+        'timestamps': ['Created Time'],
+        'numeric': ['Total', 'Quantity'],
+    },
+    'offline_all': {
+        'label': 'Offline CSV',
+        'required': ['Time', 'Transaction Type', 'Is_Cancelled', 'Total', 'Item', 'Quantity'],
+        'timestamps': ['Time'],
+        'numeric': ['Total', 'Quantity'],
+    },
+    'report_products': {
+        'label': 'Report CSV',
+        'required': ['Date / Time', 'Product Name', 'Total Items Sold'],
+        'timestamps': ['Date / Time'],
+        'numeric': ['Total Items Sold'],
+    },
+}
+
+PREFLIGHT_SAMPLE_ROWS = 200
+
+def preflight_csv(file_path, kind, view_type='daily'):
+    """
+    Validate a CSV file against the schema of its processor before full parsing.
+
+    Only the header and the first PREFLIGHT_SAMPLE_ROWS rows are read, so a bad
+    upload is rejected in milliseconds.
+
+    Args:
+        file_path: path to the uploaded CSV
+        kind: key into CSV_SCHEMAS (e.g. 'online', 'offline_products')
+        view_type: 'daily', 'hourly' or 'matrix', selects how report timestamps are parsed
+
+    Returns:
+        list of human readable problems (empty if the file looks valid)
+    """
+    schema = CSV_SCHEMAS[kind]
+    label = f"{schema['label']} ({upload_display_name(file_path)})"
+
+    try:
+        sample = read_file_sample(file_path, PREFLIGHT_SAMPLE_ROWS)
+    except pd.errors.EmptyDataError:
+        return [f"{label}: file is empty"]
+    except Exception as e:
+        return [f"{label}: could not be read as {'XLSX' if is_xlsx(file_path) else 'CSV'} ({str(e)})"]
+
+    channel = kind.split('_')[0]
+    if channel in TRANSACTION_HEADER_COLUMNS:
+        sample = sample.rename(columns=reconcile_headers(sample.columns, channel))
+
+    columns = list(sample.columns)
+    problems = []
+    missing = [col for col in schema['required'] if col not in columns]
+    if missing:
+        problems.append(f"{label}: missing required column(s) {', '.join(repr(c) for c in missing)}")
+
+    # Columns that are present are still checked, so every problem of the file is reported at once
+    timestamp_cols = [col for col in schema['timestamps'] if col in columns]
+    numeric_cols = [col for col in schema['numeric'] if col in columns]
+    report_style = kind.startswith('report')
+
+    if kind == 'report':
+        if len(columns) == 0:
+            return [f"{label}: no columns found"]
+        datetime_col, value_col = detect_report_columns(columns)
+        timestamp_cols = [datetime_col]
+        numeric_cols = [value_col]
+
+    # Same parser the processor uses for the selected view
+    parse_date = parse_report_date if report_style else parse_time_to_date
+    if view_type == 'daily':
+        parse_value = parse_date
+    elif view_type == 'matrix':
+        # The matrix needs the date and the hour of each row
+        parse_value = lambda value: parse_time_to_hour(value) if parse_date(value) is not None else None
+    else:
+        parse_value = parse_time_to_hour
+
+    for col in timestamp_cols:
+        values = sample[col].dropna().astype(str).str.strip()
+        values = values[values != '']
+        if len(values) == 0:
+            continue
+        parsed = values.apply(parse_value)
+        if parsed.notna().sum() == 0:
+            problems.append(f"{label}: column '{col}' has no recognisable timestamps (e.g. '{values.iloc[0]}')")
+
+    for col in numeric_cols:
+        values = sample[col].dropna()
+        coerced = pd.to_numeric(values, errors='coerce')
+        bad = values[coerced.isna()]
+        if len(bad) > 0:
+            problems.append(f"{label}: column '{col}' must be numeric (found '{bad.iloc[0]}')")
+
+    return problems
+
+def preflight_uploads(uploads, view_type='daily'):
+    """Run preflight_csv over (file_path, kind) pairs and collect every problem"""
+    problems = []
+    for file_path, kind in uploads:
+        if file_path:
+            problems.extend(preflight_csv(file_path, kind, view_type))
+    return problems
+
+def save_upload(file, default_name):
+    """Save an uploaded file into the upload folder and return its path (None if not uploaded)"""
+    if not file:
+        return None
+    # Unique prefix so concurrent uploads with the same name never overwrite each other
+    file_name = f"{uuid.uuid4().hex}_{secure_filename(file.filename or default_name)}"
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
+    file.save(file_path)
+    return file_path
+
+def upload_display_name(file_path):
+    """Original file name of a saved upload, without the unique prefix added by save_upload"""
+    name = os.path.basename(file_path)
+    prefix, _, rest = name.partition('_')
+    return rest if len(prefix) == 32 and rest else name
+
+def remove_uploaded_files(*paths):
+    """Delete temporary upload files, ignoring ones that are already gone"""
+    for path in paths:
+        try:
+            if path:
+                os.remove(path)
+        except:
+            pass
+
+# Rows read per chunk when a date range is pushed down into ingestion
+CSV_CHUNK_ROWS = 100000
+
+# Timestamp formats tried by parse_time_to_date, in the same order
+TIMESTAMP_FORMATS = [
+    '%m/%d/%Y %H:%M',
+    '%Y-%m-%d %H:%M:%S',
+    '%Y-%m-%d %H:%M',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y',
+    '%Y-%m-%d',
+    '%d %b %Y (%a)',
+    '%d %b %Y',
+]
+# The ones parse_time_to_hour tries before pd.to_datetime
+HOUR_FORMATS = TIMESTAMP_FORMATS[:4]
+
+def parse_date_input(date_str):
+    """Parse a YYYY-MM-DD form value into a date, returning None if blank or invalid"""
     try:
-        df = pd.read_csv(file_path)
+        if not date_str or date_str.strip() == '':
+            return None
+        return datetime.strptime(date_str.strip(), '%Y-%m-%d').date()
+    except:
+        return None
 
-        # Debug: Print column names and sample data
-        print(f"Online CSV columns: {list(df.columns)}")
-        print(f"All Status values: {df['Status'].value_counts()}")
+def parse_timestamps_vectorized(time_values, fallback=False, formats=TIMESTAMP_FORMATS):
+    """
+    Parse a timestamp column the way parse_time_to_date reads each value.
 
-        # Filter: Exclude "Cancelled" and "Pending Payment" (Include "Pending Store Acceptance")
-        excluded_statuses = ['cancelled', 'pending payment']
+    Each of formats (TIMESTAMP_FORMATS by default) is tried in turn on the values
+    not matched yet. Unmatched values are NaT unless fallback is set, in which
+    case they go through pd.to_datetime one at a time, as parse_time_to_date does last.
+    """
+    # Exports repeat the same timestamp on many lines, so each distinct value is parsed once
+    codes, uniques = pd.factorize(time_values.astype(str))
+    values = pd.Series(uniques, dtype=object).str.strip()
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[ns]')
+    for fmt in formats:
+        pending = parsed.isna()
+        if not pending.any():
+            break
+        parsed[pending] = pd.to_datetime(values[pending], format=fmt, errors='coerce')
+
+    if fallback:
+        pending = parsed.isna() & ~values.isin(['nan', 'NaN', 'None', '', 'null'])
+        for index in pending[pending].index:
+            try:
+                parsed[index] = pd.to_datetime(values[index])
+            except Exception:
+                pass
+    return pd.Series(parsed.to_numpy()[codes], index=time_values.index)
 
-        filtered_df = df[
-            ~df['Status'].str.strip().str.lower().isin(excluded_statuses)
-        ].copy()
+def business_dates_vectorized(time_values, operating_start_hour=0):
+    """
+    Vectorized counterpart of parse_time_to_date for a whole column.
 
-        print(f"Filtered online rows: {len(filtered_df)} out of {len(df)}")
-        print(f"Excluded statuses: {excluded_statuses}")
+    Each format of TIMESTAMP_FORMATS is tried in turn on the values not matched
+    yet. Values no format matches come back as NaT so the caller can fall back
+    to the per-row parser.
+    """
+    parsed = parse_timestamps_vectorized(time_values)
 
-        if len(filtered_df) > 0:
-            print("Included statuses in filtered data:")
-            print(filtered_df['Status'].value_counts())
-        else:
-            print("No online transactions match the filter criteria")
-            if view_type == 'daily':
-                return pd.Series(dtype=float)  # Empty series for daily view
+    # Shifting back by the operating start hour gives the same date as get_business_date.
+    # Copied so callers can write per-row fallback dates into it without a chained-assignment warning
+    return (parsed - pd.Timedelta(hours=operating_start_hour)).dt.normalize().copy()
+
+def timestamp_values(time_values, operating_start_hour=0, dates=True, hours=True):
+    """
+    Business date (parse_time_to_date) and hour of day (parse_time_to_hour) of every value.
+
+    Both come from one vectorized pass over TIMESTAMP_FORMATS, whose first
+    formats are the HOUR_FORMATS. Only values no format matches ("11 AM",
+    garbage) go through the per-row parsers, plus date-only values for their
+    hour. Returns (dates, hours), None for the part not asked for.
+    """
+    with_time = parse_timestamps_vectorized(time_values, formats=HOUR_FORMATS)
+
+    date_values = None
+    if dates:
+        parsed = with_time.copy()
+        date_only = parsed.isna()
+        if date_only.any():
+            parsed[date_only] = parse_timestamps_vectorized(time_values[date_only], formats=TIMESTAMP_FORMATS[len(HOUR_FORMATS):])
+        business_dates = (parsed - pd.Timedelta(hours=operating_start_hour)).dt.normalize()
+        date_values = pd.Series(business_dates.dt.date, index=time_values.index, dtype=object).where(parsed.notna(), None)
+        unparsed = parsed.isna()
+        if unparsed.any():
+            date_values[unparsed] = time_values[unparsed].apply(lambda x: parse_time_to_date(x, operating_start_hour))
+
+    hour_values = None
+    if hours:
+        hour_values = with_time.dt.hour.astype(float)
+        unparsed = with_time.isna()
+        if unparsed.any():
+            hour_values[unparsed] = time_values[unparsed].apply(parse_time_to_hour).astype(float)
+    return date_values, hour_values
+
+def filter_chunk_by_business_date(chunk, time_col, operating_start_hour=0, start_date=None, end_date=None, keep_missing_time=False):
+    """Keep the rows of a chunk whose business date falls in [start_date, end_date]"""
+    business_dates = business_dates_vectorized(chunk[time_col], operating_start_hour)
+
+    # Per-row fallback for timestamps the fast path could not parse
+    missing_time = chunk[time_col].isna() | (chunk[time_col].astype(str).str.strip() == '')
+    unparsed = business_dates.isna() & ~missing_time
+    if unparsed.any():
+        business_dates[unparsed] = pd.to_datetime(
+            chunk.loc[unparsed, time_col].apply(lambda x: parse_time_to_date(x, operating_start_hour))
+        )
+
+    in_range = business_dates.notna()
+    if start_date is not None:
+        in_range &= business_dates >= pd.Timestamp(start_date)
+    if end_date is not None:
+        in_range &= business_dates <= pd.Timestamp(end_date)
+    if keep_missing_time:
+        in_range |= missing_time
+
+    return chunk[in_range]
+
+def read_transactions_csv(file_path, time_col, operating_start_hour=0, start_date=None, end_date=None, keep_missing_time=False, kind=None):
+    """
+    Read a transaction CSV, dropping rows outside the business date range while reading.
+
+    Without a date range the whole file is read as before. With one, the file is
+    read in chunks of CSV_CHUNK_ROWS and each chunk is filtered straight away, so
+    out-of-range rows never reach status filtering, per-row parsing or grouping.
+
+    Args:
+        file_path: path to the CSV file
+        time_col: column holding the transaction timestamp
+        operating_start_hour: hour when the business day starts (0-23)
+        start_date, end_date: inclusive business date bounds (date or None)
+        keep_missing_time: keep rows with a blank timestamp (e.g. to back-fill them later)
+        kind: 'online' or 'offline'; XLSX files only load that channel's columns
+    """
+    if start_date is None and end_date is None:
+        return read_csv_file(file_path, kind=kind)
+
+    kept = []
+    total_rows = 0
+    for chunk in iter_csv_chunks(file_path, CSV_CHUNK_ROWS, kind=kind):
+        total_rows += len(chunk)
+        kept.append(filter_chunk_by_business_date(chunk, time_col, operating_start_hour, start_date, end_date, keep_missing_time))
+
+    df = pd.concat(kept) if kept else read_file_sample(file_path, 0)
+    print(f"Date range {start_date} - {end_date}: kept {len(df)} of {total_rows} rows")
+    return df
+
+def filter_by_date_range(df, date_col, start_date=None, end_date=None):
+    """Keep rows whose already parsed date column falls in [start_date, end_date]"""
+    if start_date is not None:
+        df = df[df[date_col] >= start_date]
+    if end_date is not None:
+        df = df[df[date_col] <= end_date]
+    return df
+
+# Hour-only labels such as "10:00" or "10 AM" carry no date of their own
+TIME_ONLY_PATTERN = re.compile(r'^\d{1,2}(:\d{2}){0,2}\s*([AaPp][Mm])?$')
+
+def report_row_date(value):
+    """Report date of a timestamp, or None when the label is only an hour"""
+    if TIME_ONLY_PATTERN.match(str(value).strip()):
+        return None
+    return parse_report_date(value)
+
+def filter_hourly_report_by_date_range(df, datetime_col, start_date=None, end_date=None):
+    """Apply [start_date, end_date] to hourly report rows whose timestamp carries a date; hour-only rows are kept"""
+    if start_date is None and end_date is None:
+        return df
+    dates = df[datetime_col].apply(report_row_date)
+    in_range = dates.apply(lambda date: pd.isna(date) or ((start_date is None or date >= start_date) and (end_date is None or date <= end_date)))
+    return df[in_range.astype(bool)]
+
+# Rules applied when building the canonical transaction table. The sales and
+# product reports deliberately differ, so each rule is kept separately here.
+ONLINE_SALES_EXCLUDED_STATUSES = ['cancelled', 'pending payment']  # Compared after strip/lower
+ONLINE_PRODUCT_EXCLUDED_STATUSES = ['Cancelled', 'Pending Payment']  # Compared exactly
+OFFLINE_CANCELLED_VALUES = ['TRUE', 'T', '1', 'YES']  # Sales: string spellings of Is_Cancelled
+OFFLINE_PRODUCT_TRANSACTION_TYPES = ['Sale', 'Return']  # Products: returns are netted off sales
+OFFLINE_PRODUCT_EXCLUDED_ITEMS = ['Service Charge', 'Discount', 'Tax']
+
+# The canonical transaction table keeps the raw file's index and has Channel, plus
+# Sales Time, Total, In Sales when sales are asked for and Product Time, Item,
+# Quantity, In Products when products are
+
+def normalize_online_transactions(df, sales=True, products=True, order_times=None):
+    """
+    Map an online export onto the canonical transaction table.
+
+    Sales rule: every status except Cancelled/Pending Payment (any case), revenue from Total.
+    Product rule: statuses matched exactly, Created Time back-filled by OrderId,
+    rows need a positive Quantity and a non-blank Item. order_times (see
+    first_order_times) back-fills from every file of an upload instead of df alone.
+    """
+    txns = pd.DataFrame(index=df.index)
+    txns['Channel'] = 'online'
+
+    if sales:
+        txns['Sales Time'] = df['Created Time']
+        txns['Total'] = df['Total']
+        txns['In Sales'] = ~df['Status'].str.strip().str.lower().isin(ONLINE_SALES_EXCLUDED_STATUSES)
+        print(f"Online rows in sales report: {int(txns['In Sales'].sum())} out of {len(df)}")
+
+    if products:
+        product_time = df['Created Time']
+        has_order = pd.Series(True, index=df.index)
+
+        # Auto-fill missing Created Time values with the first one in the same OrderId
+        if 'OrderId' in df.columns:
+            if order_times is not None:
+                first_time = df['OrderId'].map(order_times)
             else:
-                return pd.Series(0.0, index=range(24))  # Empty hourly series
+                first_time = df.groupby('OrderId')['Created Time'].transform('first')
+            product_time = product_time.fillna(first_time)
+            has_order = df['OrderId'].notna()
+            print(f"✅ Auto-filled {int(df['Created Time'].isna().sum() - product_time.isna().sum())} missing Created Time values")
+        else:
+            print("⚠️ OrderId column not found - skipping auto-fill step")
 
-        if view_type == 'daily':
-            # Extract business date from Created Time column using operating hours
-            filtered_df['Date'] = filtered_df['Created Time'].apply(lambda x: parse_time_to_date(x, operating_start_hour))
+        quantity = df['Quantity']
+        item = df['Item']
+        txns['Product Time'] = product_time
+        txns['Item'] = item.astype(str).str.strip()
+        txns['Quantity'] = quantity
+        txns['In Products'] = (
+            has_order &
+            ~df['Status'].isin(ONLINE_PRODUCT_EXCLUDED_STATUSES) &
+            quantity.notna() & (quantity > 0) &
+            item.notna() & (item.astype(str).str.strip() != '')
+        )
+        print(f"Online rows in product report: {int(txns['In Products'].sum())} out of {len(df)}")
+
+    return txns
+
+def first_order_times(frames):
+    """First non-blank Created Time of each OrderId over several online files, in upload order"""
+    parts = [df[['OrderId', 'Created Time']] for df in frames if 'OrderId' in df.columns]
+    if not parts:
+        return None
+    return pd.concat(parts, ignore_index=True).groupby('OrderId')['Created Time'].first()
 
-            # Remove rows where date parsing failed
-            filtered_df = filtered_df.dropna(subset=['Date'])
+def normalize_offline_transactions(df, sales=True, products=True):
+    """
+    Map an offline export onto the canonical transaction table.
 
-            print(f"Online rows after date parsing: {len(filtered_df)}")
+    Sales rule: Transaction Type "Sale" (any case) and Is_Cancelled not a true-like string.
+    Product rule: Transaction Type exactly "Sale" or "Return" with Is_Cancelled == False,
+    returns counted as negative quantities and service items excluded.
+    """
+    txns = pd.DataFrame(index=df.index)
+    txns['Channel'] = 'offline'
+
+    if sales:
+        cancelled = df['Is_Cancelled'].astype(str).str.upper().isin(OFFLINE_CANCELLED_VALUES)
+        txns['Sales Time'] = df['Time']
+        txns['Total'] = df['Total']
+        txns['In Sales'] = (df['Transaction Type'].str.strip().str.lower() == 'sale') & ~cancelled
+        print(f"Offline rows in sales report: {int(txns['In Sales'].sum())} out of {len(df)}")
+
+    if products:
+        quantity = df['Quantity']
+        item = df['Item'].astype(str).str.strip()
+        transaction_type = df['Transaction Type']
+        txns['Product Time'] = df['Time']
+        txns['Item'] = item
+        # Signed quantities: positive for sales, negative for returns
+        txns['Quantity'] = quantity.where(transaction_type == 'Sale', -quantity)
+        txns['In Products'] = (
+            transaction_type.isin(OFFLINE_PRODUCT_TRANSACTION_TYPES) &
+            (df['Is_Cancelled'] == False) &
+            quantity.notna() & (quantity > 0) &
+            df['Item'].notna() & (item != '') &
+            ~item.isin(OFFLINE_PRODUCT_EXCLUDED_ITEMS)
+        )
+        print(f"Offline rows in product report: {int(txns['In Products'].sum())} out of {len(df)}")
+
+    return txns
+
+def exclusion_reasons(df, channel, kind):
+    """
+    Explain, per raw row, why the sales or product rule leaves it out ('' when it is kept).
 
-            # Group by date and sum Total column
-            daily_totals = filtered_df.groupby('Date')['Total'].sum()
-            return daily_totals
+    Mirrors the In Sales / In Products conditions of the normalizers, checked in order.
+    """
+    blank = pd.Series('', index=df.index)
+    quantity = pd.to_numeric(df['Quantity'], errors='coerce') if 'Quantity' in df.columns else blank
+    item = df['Item'].astype(str).str.strip() if 'Item' in df.columns else blank
+
+    if channel == 'online' and kind == 'sales':
+        conditions = [df['Status'].str.strip().str.lower().isin(ONLINE_SALES_EXCLUDED_STATUSES)]
+        reasons = ['Status is ' + df['Status'].astype(str)]
+    elif channel == 'online':
+        no_order = df['OrderId'].isna() if 'OrderId' in df.columns else pd.Series(False, index=df.index)
+        conditions = [
+            no_order,
+            df['Status'].isin(ONLINE_PRODUCT_EXCLUDED_STATUSES),
+            ~(quantity > 0),
+            df['Item'].isna() | (item == ''),
+        ]
+        reasons = ['No OrderId', 'Status is ' + df['Status'].astype(str), 'Quantity is not positive', 'Blank Item']
+    elif kind == 'sales':
+        conditions = [
+            df['Transaction Type'].str.strip().str.lower() != 'sale',
+            df['Is_Cancelled'].astype(str).str.upper().isin(OFFLINE_CANCELLED_VALUES),
+        ]
+        reasons = ['Transaction Type is ' + df['Transaction Type'].astype(str), 'Cancelled']
+    else:
+        conditions = [
+            ~df['Transaction Type'].isin(OFFLINE_PRODUCT_TRANSACTION_TYPES),
+            df['Is_Cancelled'] != False,
+            ~(quantity > 0),
+            df['Item'].isna() | (item == ''),
+            item.isin(OFFLINE_PRODUCT_EXCLUDED_ITEMS),
+        ]
+        reasons = ['Transaction Type is ' + df['Transaction Type'].astype(str), 'Cancelled', 'Quantity is not positive',
+                   'Blank Item', 'Item is ' + item]
+
+    reasons = [reason.to_numpy(dtype=object) if isinstance(reason, pd.Series) else reason for reason in reasons]
+    return pd.Series(np.select([c.fillna(True).to_numpy(dtype=bool) for c in conditions], reasons, default=''),
+                     index=df.index, dtype=object)
+
+# Columns identifying one transaction line, used to spot rows repeated across overlapping exports.
+# Status and Is_Cancelled are left out because they can change between two exports of the same sale.
+DEDUP_KEY_COLUMNS = {
+    'online': ['OrderId', 'Item', 'Quantity', 'Total'],
+    'offline': ['Time', 'Transaction Type', 'Item', 'Quantity', 'Total'],
+}
+# Receipt or line ids, added to the key when the file has them (header variants match too)
+DEDUP_ID_COLUMNS = {
+    'online': ['Line Id'],
+    'offline': ['Receipt', 'Line Id'],
+}
+
+def dedup_key_columns(columns, channel):
+    """Key columns of channel present in columns, id columns first"""
+    wanted = {header_key(col) for col in DEDUP_ID_COLUMNS[channel]}
+    id_columns = [col for col in columns if header_key(col) in wanted]
+    return id_columns + [col for col in DEDUP_KEY_COLUMNS[channel] if col in columns]
+
+def transaction_key_hashes(df, key_columns):
+    """
+    Hash each row's key columns and occurrence number to one uint64.
+
+    Numeric columns are compared as floats and text is stripped, so "2" and
+    "2.0" or "Latte " and "Latte" from two exports give the same key. The n-th
+    row with a given key gets occurrence n, so identical lines within a file
+    keep distinct hashes and only match the n-th such line of another export.
+    """
+    keys = pd.DataFrame(index=df.index)
+    for col in key_columns:
+        if pd.api.types.is_numeric_dtype(df[col]) or col in ('Quantity', 'Total'):
+            keys[col] = pd.to_numeric(df[col], errors='coerce').astype(float)
         else:
-            # Extract hour from Created Time column
-            filtered_df['Hour'] = filtered_df['Created Time'].apply(parse_time_to_hour)
+            keys[col] = df[col].astype(str).str.strip().where(df[col].notna(), None)
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    occurrence = pd.Series(hashes).groupby(hashes).cumcount().to_numpy()
+    return pd.util.hash_pandas_object(pd.DataFrame({'key': hashes, 'occurrence': occurrence}), index=False).to_numpy()
 
-            # Remove rows where hour parsing failed
-            filtered_df = filtered_df.dropna(subset=['Hour'])
+class TransactionHashIndex:
+    """
+    Compact index of transaction keys seen so far for one channel.
 
-            print(f"Online rows after time parsing: {len(filtered_df)}")
+    Keys are stored as 64-bit hashes in a few sorted numpy arrays (8 bytes
+    per key), so tens of millions of transactions fit in a few hundred
+    MB. Reuse one index across every file of a channel to drop rows repeated
+    between overlapping exports; rows repeated within one file are kept (see
+    transaction_key_hashes). The first file's copy of a row is kept.
+    """
 
-            if len(filtered_df) == 0:
-                print("No valid time data found in online CSV")
-                return pd.Series(0.0, index=range(24))
+    def __init__(self, channel):
+        self.channel = channel
+        self.sorted_hashes = []
+        self.removed = 0
+
+    def seen(self, hashes):
+        """Boolean mask of hashes already in the index"""
+        order = np.argsort(hashes)
+        needles = hashes[order]  # Sorted needles keep searchsorted cache friendly
+        found = np.zeros(len(hashes), dtype=bool)
+        for known in self.sorted_hashes:
+            positions = np.minimum(np.searchsorted(known, needles), len(known) - 1)
+            found[order] |= known[positions] == needles
+        return found
+
+    def add(self, hashes):
+        """Remember new hashes, merging arrays of similar size so only about log2(files) arrays are searched"""
+        self.sorted_hashes.append(np.sort(hashes))
+        while len(self.sorted_hashes) > 1 and len(self.sorted_hashes[-2]) <= len(self.sorted_hashes[-1]):
+            newest = self.sorted_hashes.pop()
+            self.sorted_hashes[-1] = np.sort(np.concatenate([self.sorted_hashes[-1], newest]), kind='mergesort')
+
+    def drop_duplicates(self, df):
+        """Return df without rows whose key was already seen, and remember the new keys"""
+        key_columns = dedup_key_columns(list(df.columns), self.channel)
+        if self.channel == 'online' and 'OrderId' not in key_columns:
+            print("⚠️ OrderId column not found - deduplicating online rows on line contents only")
+        if len(df) == 0 or not key_columns:
+            return df
+
+        hashes = transaction_key_hashes(df, key_columns)
+        # Only the new keys are searched in the arrays of earlier files; nothing seen before is re-hashed
+        duplicated = self.seen(hashes)
+        if not duplicated.all():
+            self.add(hashes[~duplicated])
+
+        removed = int(duplicated.sum())
+        self.removed += removed
+        print(f"{self.channel.capitalize()} deduplication: removed {removed} of {len(df)} rows")
+        return df[~duplicated]
+
+# Per channel: timestamp column, normalizer, and whether blank timestamps must survive ingestion
+TRANSACTION_SOURCES = {
+    'online': ('Created Time', normalize_online_transactions, True),
+    'offline': ('Time', normalize_offline_transactions, False),
+}
+
+# Canonical columns of each transaction export; header variants of these names are renamed on read
+TRANSACTION_HEADER_COLUMNS = {
+    'online': ['OrderId', 'Created Time', 'Status', 'Total', 'Item', 'Quantity'],
+    'offline': ['Time', 'Transaction Type', 'Is_Cancelled', 'Total', 'Item', 'Quantity'],
+}
+
+def header_key(name):
+    """Compare column names ignoring case, spaces, underscores and a byte order mark"""
+    return re.sub(r'[\s_]+', '', str(name).replace('\ufeff', '')).lower()
+
+def reconcile_headers(columns, channel):
+    """
+    Return a rename mapping from header variants to canonical names.
 
-            # Group by hour and sum Total column
-            hourly_totals = filtered_df.groupby('Hour')['Total'].sum()
+    Files of one channel often come from different terminals or platform versions
+    ("Created_Time", "created time", "IS_CANCELLED "). A column is only renamed
+    when the canonical name is not already present.
+    """
+    canonical = {header_key(col): col for col in TRANSACTION_HEADER_COLUMNS[channel]}
+    columns = list(columns)
+    rename = {}
+    for col in columns:
+        target = canonical.get(header_key(col))
+        if target and col != target and target not in columns and target not in rename.values():
+            rename[col] = target
+    return rename
+
+def read_channel_file(file_path, channel, operating_start_hour=0, start_date=None, end_date=None, keep_missing_time=False):
+    """Read one online or offline CSV or XLSX, renaming header variants to the canonical column names"""
+    time_col = TRANSACTION_SOURCES[channel][0]
+    rename = reconcile_headers(read_file_sample(file_path, 0).columns, channel)
+    if rename:
+        print(f"{channel.capitalize()} CSV header reconciled: {rename}")
+    file_time_col = {target: col for col, target in rename.items()}.get(time_col, time_col)
+    df = read_transactions_csv(file_path, file_time_col, operating_start_hour, start_date, end_date, keep_missing_time, kind=channel)
+    return df.rename(columns=rename)
+
+def map_files(func, file_paths):
+    """
+    Apply func to every file in a thread pool of PARSE_WORKERS, returning results in upload order.
 
-            print(f"Online hourly totals calculated: {hourly_totals.sum():.2f}")
+    The CSV readers release the GIL, so reads overlap; timestamp parsing mostly
+    does not, which is why it is vectorized (see timestamp_values).
+    """
+    if len(file_paths) <= 1:
+        return [func(file_path) for file_path in file_paths]
+    with ThreadPoolExecutor(max_workers=min(len(file_paths), app.config['PARSE_WORKERS'])) as pool:
+        return list(pool.map(func, file_paths))
 
-            # Create series for all 24 hours (0-23)
-            result = pd.Series(0.0, index=range(24))
-            result.update(hourly_totals)
+def ingest_channel_files(file_paths, channel, aggregate, operating_start_hour=0, start_date=None, end_date=None, sales=True, products=True, hash_index=None, drilldown=None):
+    """
+    Ingest every file of one channel and return aggregate(txns) for each, in upload order.
 
-            return result
+    Files are read in parallel. Repeated rows are then dropped one file at a time
+    in upload order, so the copy kept does not depend on which read finished
+    first. Normalizing and aggregating run in parallel again; callers merge the
+    partial results (see merge_sales_series and merge_product_frames).
+    """
+    time_col, normalize, keep_missing_time = TRANSACTION_SOURCES[channel]
+    # Blank online timestamps are only useful to the product back-fill
+    frames = map_files(lambda file_path: read_channel_file(file_path, channel, operating_start_hour, start_date, end_date,
+                                                           keep_missing_time=keep_missing_time and products), file_paths)
+    for file_path, df in zip(file_paths, frames):
+        print(f"{channel.capitalize()} CSV columns ({upload_display_name(file_path)}): {list(df.columns)}")
+    if hash_index is not None:
+        frames = [hash_index.drop_duplicates(df) for df in frames]
+    # An order can be split across files of one upload, so the product back-fill looks at all of them
+    normalize_options = {}
+    if channel == 'online' and products and len(frames) > 1:
+        normalize_options['order_times'] = first_order_times(frames)
+
+    def finish(position):
+        df = frames[position]
+        txns = normalize(df, sales=sales, products=products, **normalize_options)
+        if drilldown is not None:
+            txns = drilldown.add(channel, df, txns, upload_display_name(file_paths[position]))
+        return aggregate(txns)
+
+    return map_files(finish, list(range(len(file_paths))))
+
+def as_path_list(file_path):
+    """Accept a single path or a list of paths (several files uploaded for one field)"""
+    return [file_path] if isinstance(file_path, str) else list(file_path)
+
+def merge_sales_series(partials, view_type='hourly'):
+    """
+    Sum partial sales series by date (daily), hour (hourly) or date row (matrix).
+
+    Addition per bucket is associative, so files can be merged in any grouping.
+    """
+    if len(partials) == 1:
+        return partials[0]
+    if view_type == 'hourly':
+        result = pd.Series(0.0, index=range(24))
+        for partial in partials:
+            result = result.add(partial, fill_value=0.0)
+        return result
+    partials = [partial for partial in partials if len(partial) > 0]
+    if not partials:
+        return empty_sales_series(view_type)
+    return pd.concat(partials).groupby(level=0).sum()
+
+def merge_product_frames(partials):
+    """Sum partial product frames per (Date, Item), or per (Date, Hour, Item) in the matrix view"""
+    partials = [partial for partial in partials if len(partial) > 0]
+    if len(partials) == 1:
+        return partials[0]
+    if not partials:
+        return pd.DataFrame(columns=['Date', 'Item', 'Quantity'])
+    keys = [col for col in partials[0].columns if col != 'Quantity']
+    return pd.concat(partials, ignore_index=True).groupby(keys)['Quantity'].sum().reset_index()
+
+def empty_sales_series(view_type='hourly'):
+    """Sales result without any rows: no dates (daily), 24 zero hours (hourly) or a matrix without dates"""
+    if view_type == 'daily':
+        return pd.Series(dtype=float)
+    if view_type == 'matrix':
+        return pivot_hours(pd.DataFrame(), ['Date'], 'Total')
+    return pd.Series(0.0, index=range(24))
+
+def pivot_hours(df, index_cols, value_col):
+    """
+    Sum value_col per (index_cols..., Hour) in one grouping and pivot the hours into columns.
+
+    Returns the date × hour matrix: one row per index_cols key, one column per
+    hour of day (0-23), zero where nothing was recorded.
+    """
+    if len(df) > 0 and 'Hour' in df.columns:
+        df = df.dropna(subset=index_cols + ['Hour'])
+    if len(df) == 0 or 'Hour' not in df.columns:
+        if len(index_cols) > 1:
+            index = pd.MultiIndex.from_tuples([], names=index_cols)
+        else:
+            index = pd.Index([], name=index_cols[0], dtype=object)
+        return pd.DataFrame(0.0, index=index, columns=range(24))
+    table = df.astype({'Hour': int}).groupby(index_cols + ['Hour'])[value_col].sum().unstack('Hour', fill_value=0.0)
+    return table.reindex(columns=range(24), fill_value=0.0).astype(float)
+
+def split_date_hour_keys(keys):
+    """Date and Hour columns of non-missing (date, hour) bucket keys"""
+    keys = keys.dropna()
+    return pd.DataFrame(keys.tolist(), index=keys.index, columns=['Date', 'Hour'])
+
+def aggregate_sales(txns, view_type='hourly', operating_start_hour=0):
+    """Sum sales revenue of a canonical transaction table by business date, hour of day or both (matrix)"""
+    filtered_df = txns[txns['In Sales']].copy()
+
+    if len(filtered_df) == 0:
+        return empty_sales_series(view_type)
+
+    # Keys already computed by a DrillDownIndex are reused instead of parsing every timestamp again
+    if 'Sales Bucket' in filtered_df.columns:
+        bucket_keys = filtered_df['Sales Bucket']
+    else:
+        bucket_keys = sales_bucket_keys(filtered_df['Sales Time'], view_type, operating_start_hour)
+
+    if view_type == 'matrix':
+        # Business date and hour of every row, summed in one grouping and pivoted to one column per hour
+        keys = split_date_hour_keys(bucket_keys)
+        keys['Total'] = filtered_df['Total']
+        return pivot_hours(keys, ['Date'], 'Total')
+    elif view_type == 'daily':
+        # Extract business date using operating hours
+        filtered_df['Date'] = bucket_keys
+
+        # Remove rows where date parsing failed
+        filtered_df = filtered_df.dropna(subset=['Date'])
+
+        # Group by date and sum Total column
+        return filtered_df.groupby('Date')['Total'].sum()
+    else:
+        # Extract hour of day
+        filtered_df['Hour'] = bucket_keys
+
+        # Remove rows where hour parsing failed
+        filtered_df = filtered_df.dropna(subset=['Hour'])
+
+        # Group by hour and sum Total column
+        hourly_totals = filtered_df.groupby('Hour')['Total'].sum()
+
+        # Create series for all 24 hours (0-23)
+        result = pd.Series(0.0, index=range(24))
+        result.update(hourly_totals)
+
+        return result
+
+def aggregate_products(txns, view_type='daily', operating_start_hour=0, start_date=None, end_date=None, hourly_requires_date=False):
+    """
+    Sum product quantities of a canonical transaction table by date/hour and item.
+
+    hourly_requires_date keeps the online rule that a row needs a valid business
+    date even in the hourly view.
+    """
+    df = txns[txns['In Products']].copy()
+
+    # Date for the daily view, hour for the hourly one, (date, hour) for the matrix; NaN where the row is dropped
+    if 'Product Bucket' in df.columns:
+        df['Date'] = df['Product Bucket']
+    else:
+        df['Date'] = product_bucket_keys(df['Product Time'], view_type, operating_start_hour, start_date, end_date, hourly_requires_date)
+    df = df.dropna(subset=['Date'])
+    if view_type == 'matrix':
+        df = split_date_hour_keys(df['Date']).assign(Item=df['Item'], Quantity=df['Quantity'])
+        return df.groupby(['Date', 'Hour', 'Item'])['Quantity'].sum().reset_index()
+    return df.groupby(['Date', 'Item'])['Quantity'].sum().reset_index()
+
+def sales_bucket_keys(times, view_type='hourly', operating_start_hour=0):
+    """Business date (daily), hour of day (hourly) or both (matrix) of each sales timestamp, None if unparseable"""
+    if view_type == 'daily':
+        return timestamp_values(times, operating_start_hour, hours=False)[0]
+    if view_type == 'matrix':
+        return date_hour_keys(*timestamp_values(times, operating_start_hour))
+    return timestamp_values(times, dates=False)[1]
+
+def date_hour_keys(dates, hours):
+    """(business date, hour) bucket of each row for the matrix view, None where either is missing"""
+    return pd.Series([(date, int(hour)) if pd.notna(date) and pd.notna(hour) else None for date, hour in zip(dates, hours)],
+                     index=dates.index, dtype=object)
+
+def product_bucket_keys(times, view_type='daily', operating_start_hour=0, start_date=None, end_date=None, hourly_requires_date=False):
+    """
+    Date (daily) or hour (hourly) each product timestamp is counted under.
+
+    Rows without a valid business date in [start_date, end_date] get NaN, except
+    in the hourly view without hourly_requires_date, where only the hour matters.
+    The matrix view always needs both the date and the hour.
+    """
+    if view_type == 'hourly' and not hourly_requires_date:
+        return timestamp_values(times, dates=False)[1]
+
+    dates, hours = timestamp_values(times, operating_start_hour, hours=view_type != 'daily')
+    in_range = dates.notna()
+    if start_date is not None:
+        in_range[in_range] = dates[in_range] >= start_date
+    if end_date is not None:
+        in_range[in_range] = dates[in_range] <= end_date
+
+    if view_type == 'hourly':
+        return hours.where(in_range)
+    if view_type == 'matrix':
+        return date_hour_keys(dates.where(in_range), hours)
+    return dates.where(in_range)
+
+class DrillDownIndex:
+    """
+    Per-upload index from each report row to the transactions behind it.
+
+    Only built when the user asks for drill-down. Every ingested file is then
+    written once to DRILLDOWN_FOLDER/<token>/ as JSON lines (one raw row each, with its line number and exclusion reasons) plus
+    the byte offset of every line. For each sales bucket (date or hour) and
+    product bucket (date or hour, item) the row positions are stored grouped
+    together, so a lookup seeks straight to the matching lines and costs time
+    proportional to the answer rather than to the file. Rows dropped by the
+    status, cancellation or Transaction Type rules are indexed too, flagged
+    with the reason they were left out.
+    """
+
+    def __init__(self, view_type='daily', operating_start_hour=0, start_date=None, end_date=None):
+        self.token = uuid.uuid4().hex
+        self.path = os.path.join(DRILLDOWN_FOLDER, self.token)
+        self.view_type = view_type
+        self.operating_start_hour = operating_start_hour
+        self.start_date = start_date
+        self.end_date = end_date
+        self.parts = 0
+        # (report, bucket, item, channel) -> list of (part, start, stop) slices of that part's order array
+        self.buckets = {}
+        self.lock = threading.Lock()  # Files of one field are indexed from several threads
+        os.makedirs(self.path)
+
+    def add(self, channel, df, txns, source):
+        """
+        Index one file's raw rows (df) and their canonical transactions (txns).
+
+        Returns txns with the 'Sales Bucket' / 'Product Bucket' key of every
+        row, which aggregate_sales and aggregate_products reuse.
+        """
+        with self.lock:
+            part = f'{channel}-{self.parts}'
+            self.parts += 1
+
+        records = df.copy()
+        records.insert(0, 'File', source)
+        records.insert(1, 'Line', df.index + 2)  # Spreadsheet line, counting the header as line 1
+
+        groups = []
+        if 'In Sales' in txns.columns:
+            reasons = exclusion_reasons(df, channel, 'sales').where(~txns['In Sales'], '')
+            records['Sales Exclusion'] = reasons.mask(~txns['In Sales'] & (reasons == ''), 'Excluded')
+            keys = sales_bucket_keys(txns['Sales Time'], self.view_type, self.operating_start_hour)
+            txns = txns.assign(**{'Sales Bucket': keys})
+            groups.append(('sales', keys, None))
+        if 'In Products' in txns.columns:
+            reasons = exclusion_reasons(df, channel, 'products').where(~txns['In Products'], '')
+            records['Product Exclusion'] = reasons.mask(~txns['In Products'] & (reasons == ''), 'Excluded')
+            keys = product_bucket_keys(txns['Product Time'], self.view_type, self.operating_start_hour,
+                                       self.start_date, self.end_date, hourly_requires_date=channel == 'online')
+            txns = txns.assign(**{'Product Bucket': keys})
+            groups.append(('products', keys, txns['Item']))
+
+        # JSON lines escape embedded newlines, so line starts are the row offsets
+        data = records.to_json(orient='records', lines=True, date_format='iso', default_handler=str).encode('utf-8')
+        if data and not data.endswith(b'\n'):
+            data += b'\n'
+        with open(os.path.join(self.path, f'{part}.jsonl'), 'wb') as f:
+            f.write(data)
+        line_ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == ord('\n'))
+        np.save(os.path.join(self.path, f'{part}.offsets.npy'), np.concatenate([[0], line_ends[:-1] + 1]).astype(np.int64))
+
+        # Positions grouped by bucket, one contiguous slice per bucket
+        order = []
+        slices = []
+        start = 0
+        for report, keys, items in groups:
+            valid = keys.notna().to_numpy()
+            bucket_labels = pd.Series([drilldown_bucket_label(key) for key in keys[valid]], dtype=object)
+            grouping = [bucket_labels] if items is None else [bucket_labels, items[valid].reset_index(drop=True)]
+            positions = np.flatnonzero(valid)
+            for group_key, group_positions in pd.Series(positions).groupby(grouping).indices.items():
+                bucket, item = (group_key, None) if items is None else group_key
+                order.append(positions[group_positions])
+                stop = start + len(group_positions)
+                slices.append(((report, bucket, item, channel), (part, start, stop)))
+                start = stop
+        np.save(os.path.join(self.path, f'{part}.order.npy'),
+                np.concatenate(order).astype(np.int64) if order else np.empty(0, dtype=np.int64))
+        with self.lock:
+            for key, part_slice in slices:
+                self.buckets.setdefault(key, []).append(part_slice)
+        return txns
+
+    def save(self):
+        """Write the bucket table as JSON so drill-down requests (from any worker) can find the rows"""
+        entries = [[*key, [[part, int(start), int(stop)] for part, start, stop in part_slices]]
+                   for key, part_slices in self.buckets.items()]
+        write_atomically(os.path.join(self.path, 'buckets.json'), json.dumps(entries).encode('utf-8'))
+
+    def discard(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+# Drill-down report kinds and the column holding each one's exclusion reason
+DRILLDOWN_REPORTS = {'sales': 'Sales Exclusion', 'products': 'Product Exclusion'}
+
+def drilldown_bucket_label(key):
+    """Stable text form of a bucket key: ISO date (daily), hour number (hourly) or date and hour (matrix)"""
+    if isinstance(key, tuple):
+        return f"{key[0].isoformat()}T{int(key[1]):02d}"
+    if hasattr(key, 'isoformat'):
+        return key.isoformat()
+    return str(int(key))
+
+def remove_expired_drilldowns():
+    """Delete drill-down indexes older than DRILLDOWN_MAX_AGE_SECONDS"""
+    if not os.path.isdir(DRILLDOWN_FOLDER):
+        return
+    cutoff = time.time() - app.config['DRILLDOWN_MAX_AGE_SECONDS']
+    for token in os.listdir(DRILLDOWN_FOLDER):
+        path = os.path.join(DRILLDOWN_FOLDER, token)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            pass
+
+DRILLDOWN_EXPIRY_INTERVAL_SECONDS = 60
+drilldown_expiry = {'last_run': 0.0}
+
+@app.before_request
+def expire_drilldowns():
+    """Delete expired drill-down indexes on incoming requests, at most once a minute per worker"""
+    now = time.time()
+    if now - drilldown_expiry['last_run'] >= DRILLDOWN_EXPIRY_INTERVAL_SECONDS:
+        drilldown_expiry['last_run'] = now
+        remove_expired_drilldowns()
+
+def lookup_drilldown(token, report, bucket, item=None):
+    """
+    Return {channel: [row dicts]} for the transactions behind one report row.
+
+    Returns None when the token is unknown or has expired.
+    """
+    path = os.path.join(DRILLDOWN_FOLDER, token)
+    try:
+        with open(os.path.join(path, 'buckets.json'), 'rb') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return None
+    buckets = {tuple(entry[:4]): entry[4] for entry in entries}
+
+    result = {}
+    for channel in ('online', 'offline'):
+        rows = []
+        for part, start, stop in buckets.get((report, bucket, item, channel), []):
+            order = np.load(os.path.join(path, f'{part}.order.npy'), mmap_mode='r')
+            offsets = np.load(os.path.join(path, f'{part}.offsets.npy'), mmap_mode='r')
+            with open(os.path.join(path, f'{part}.jsonl'), 'rb') as f:
+                for position in sorted(order[start:stop]):
+                    f.seek(int(offsets[position]))
+                    rows.append(json.loads(f.readline()))
+        result[channel] = rows
+    return result
+
+def process_offline_csv(file_path, view_type='hourly', operating_start_hour=0, start_date=None, end_date=None, hash_index=None, drilldown=None):
+    """Process offline CSV file(s) according to filtering rules"""
+    try:
+        partials = ingest_channel_files(as_path_list(file_path), 'offline', lambda txns: aggregate_sales(txns, view_type, operating_start_hour),
+                                        operating_start_hour, start_date, end_date, products=False, hash_index=hash_index, drilldown=drilldown)
+        return merge_sales_series(partials, view_type)
+
+    except Exception as e:
+        raise Exception(f"Error processing offline CSV: {str(e)}")
+
+def process_online_csv(file_path, view_type='hourly', operating_start_hour=0, start_date=None, end_date=None, hash_index=None, drilldown=None):
+    """Process online CSV file(s) according to filtering rules"""
+    try:
+        partials = ingest_channel_files(as_path_list(file_path), 'online', lambda txns: aggregate_sales(txns, view_type, operating_start_hour),
+                                        operating_start_hour, start_date, end_date, products=False, hash_index=hash_index, drilldown=drilldown)
+        result = merge_sales_series(partials, view_type)
+        print(f"Online {view_type} totals calculated: {result.to_numpy().sum():.2f}")
+        return result
 
     except Exception as e:
         raise Exception(f"Error processing online CSV: {str(e)}")
 
-def process_report_csv(file_path, view_type='hourly', operating_start_hour=0):
-    """Process report CSV file and extract hourly or daily data"""
+def process_report_csv(file_path, view_type='hourly', operating_start_hour=0, start_date=None, end_date=None):
+    """Process report CSV file(s) and extract hourly or daily data"""
+    if not isinstance(file_path, str):
+        partials = map_files(lambda path: process_report_csv(path, view_type, operating_start_hour, start_date, end_date), file_path)
+        return merge_sales_series(partials, view_type)
+
     try:
-        df = pd.read_csv(file_path)
+        df = read_csv_file(file_path, kind='report')
 
         # Debug: Print column names and sample data
         print(f"Report CSV columns: {list(df.columns)}")
@@ -306,29 +1520,7 @@ def process_report_csv(file_path, view_type='hourly', operating_start_hour=0):
         print(df.head(3))
 
         # Try to identify the datetime and value columns
-        datetime_col = None
-        value_col = None
-
-        # Look for common datetime column names
-        datetime_candidates = ['datetime', 'date_time', 'time', 'timestamp', 'created_time', 'date', 'date / time']
-        for col in df.columns:
-            if col.lower().strip() in datetime_candidates or 'time' in col.lower() or 'date' in col.lower():
-                datetime_col = col
-                break
-
-        # Look for common value column names
-        value_candidates = ['total', 'amount', 'value', 'sum', 'revenue', 'total sales', 'sales']
-        for col in df.columns:
-            col_lower = col.lower().strip()
-            if col_lower in value_candidates or 'total' in col_lower or 'sales' in col_lower:
-                value_col = col
-                break
-
-        # If not found, use the first two columns
-        if datetime_col is None:
-            datetime_col = df.columns[0]
-        if value_col is None:
-            value_col = df.columns[1] if len(df.columns) > 1 else df.columns[0]
+        datetime_col, value_col = detect_report_columns(df.columns)
 
         print(f"Using datetime column: {datetime_col}")
         print(f"Using value column: {value_col}")
@@ -340,6 +1532,7 @@ def process_report_csv(file_path, view_type='hourly', operating_start_hour=0):
 
             # Remove rows where date parsing failed
             df = df.dropna(subset=['Date'])
+            df = filter_by_date_range(df, 'Date', start_date, end_date)
 
             print(f"Report rows after date parsing: {len(df)}")
 
@@ -349,12 +1542,28 @@ def process_report_csv(file_path, view_type='hourly', operating_start_hour=0):
             print(f"Report daily totals calculated: {daily_totals.sum():.2f}")
 
             return daily_totals
+        elif view_type == 'matrix':
+            # Report date and hour of each row, so rows need both
+            df['Date'] = df[datetime_col].apply(parse_report_date)
+            df['Hour'] = df[datetime_col].apply(parse_time_to_hour)
+            df = df.dropna(subset=['Date', 'Hour'])
+            df = filter_by_date_range(df, 'Date', start_date, end_date)
+
+            print(f"Report rows after date and time parsing: {len(df)}")
+
+            # One grouping per (date, hour), pivoted to one column per hour
+            matrix = pivot_hours(df, ['Date'], value_col)
+
+            print(f"Report date x hour totals calculated: {matrix.to_numpy().sum():.2f}")
+
+            return matrix
         else:
             # Extract hour from datetime column
             df['Hour'] = df[datetime_col].apply(parse_time_to_hour)
 
             # Remove rows where hour parsing failed
             df = df.dropna(subset=['Hour'])
+            df = filter_hourly_report_by_date_range(df, datetime_col, start_date, end_date)
 
             print(f"Report rows after time parsing: {len(df)}")
 
@@ -383,153 +1592,40 @@ def format_hour_label(hour):
     else:
         return f"{hour-12:02d} PM"
 
-def process_online_csv_for_products(file_path, view_type='daily', operating_start_hour=0):
-    """Process online CSV file for product quantity analysis"""
+def process_online_csv_for_products(file_path, view_type='daily', operating_start_hour=0, start_date=None, end_date=None, hash_index=None, drilldown=None):
+    """Process online CSV file(s) for product quantity analysis"""
     try:
-        df = pd.read_csv(file_path)
-        print(f"Online CSV columns: {df.columns.tolist()}")
-
-        # STEP 1: Auto-fill missing Created Time values by matching OrderId
-        print("🔄 Auto-filling missing Created Time values...")
-
-        # Check if OrderId column exists
-        if 'OrderId' in df.columns:
-            # Count initial missing values
-            initial_missing = df['Created Time'].isna().sum()
-            print(f"Initial missing Created Time values: {initial_missing}")
-
-            # For each OrderId group, fill missing Created Time with the first non-null value
-            def fill_created_time(group):
-                # Get the first non-null Created Time in this OrderId group
-                valid_times = group['Created Time'].dropna()
-                if len(valid_times) > 0:
-                    fill_value = valid_times.iloc[0]
-                    missing_count = group['Created Time'].isna().sum()
-                    if missing_count > 0:
-                        print(f"  📝 OrderId {group['OrderId'].iloc[0]}: Filling {missing_count} missing times with '{fill_value}'")
-                        group['Created Time'] = group['Created Time'].fillna(fill_value)
-                return group
-
-            df = df.groupby('OrderId', group_keys=False).apply(fill_created_time)
-
-            # Count how many values were filled
-            final_missing = df['Created Time'].isna().sum()
-            filled_count = initial_missing - final_missing
-            print(f"✅ Auto-filled {filled_count} missing Created Time values")
-        else:
-            print("⚠️ OrderId column not found - skipping auto-fill step")
-
-        # STEP 2: Apply existing filtering logic
-        # Filter out records where Status is "Cancelled" or "Pending Payment" (as per user requirements)
-        excluded_statuses = ['Cancelled', 'Pending Payment']
-        print(f"Status values in online CSV: {df['Status'].unique().tolist()}")
-        print(f"Excluding statuses: {excluded_statuses}")
-        df_before_status = len(df)
-        df = df[~df['Status'].isin(excluded_statuses)]
-        print(f"Rows after status filtering: {len(df)} (was {df_before_status})")
-
-        # Include only rows where Quantity has a value (> 0)
-        print(f"Quantity values before filtering: {df['Quantity'].value_counts().to_dict()}")
-        df_before_qty = len(df)
-        df = df[df['Quantity'].notna() & (df['Quantity'] > 0)]
-        print(f"Rows after quantity filtering: {len(df)} (was {df_before_qty})")
-
-        # Group by Item (exclude blank)
-        print(f"Item values before filtering: {df['Item'].value_counts().head(10).to_dict()}")
-        df_before_item = len(df)
-        df = df[df['Item'].notna() & (df['Item'].astype(str).str.strip() != '')]
-        print(f"Rows after item filtering: {len(df)} (was {df_before_item})")
-
-        # Debug: Show what items we have after filtering
-        if len(df) > 0:
-            print(f"Final items after all filtering: {df['Item'].value_counts().to_dict()}")
-        else:
-            print("❌ No items remaining after filtering!")
-
-        # Clean item names
-        df['Item'] = df['Item'].astype(str).str.strip()
-
-        # Parse dates and apply operating hours logic
-        df['Date'] = df['Created Time'].apply(lambda x: parse_time_to_date(x, operating_start_hour))
-
-        # Debug: Show how many rows have valid dates
-        valid_dates = df['Date'].notna().sum()
-        total_rows = len(df)
-        print(f"Rows with valid dates: {valid_dates} out of {total_rows}")
-
-        # Only keep rows with valid dates
-        df = df.dropna(subset=['Date'])
-        print(f"Final rows after date filtering: {len(df)}")
-
-        # Group by date/hour and item, sum quantities
-        if view_type == 'hourly':
-            # Extract hour from Created Time for hourly grouping
-            df['Hour'] = df['Created Time'].apply(parse_time_to_hour)
-            df = df.dropna(subset=['Hour'])
-            product_data = df.groupby(['Hour', 'Item'])['Quantity'].sum().reset_index()
-            # Rename Hour column to Date for consistency
-            product_data = product_data.rename(columns={'Hour': 'Date'})
-        else:
-            # Daily grouping (default)
-            product_data = df.groupby(['Date', 'Item'])['Quantity'].sum().reset_index()
-
+        partials = ingest_channel_files(as_path_list(file_path), 'online',
+                                        lambda txns: aggregate_products(txns, view_type, operating_start_hour, start_date, end_date, hourly_requires_date=True),
+                                        operating_start_hour, start_date, end_date, sales=False, hash_index=hash_index, drilldown=drilldown)
+        product_data = merge_product_frames(partials)
         print(f"Online product data processed: {len(product_data)} records")
         return product_data
 
     except Exception as e:
         raise Exception(f"Error processing online CSV for products: {str(e)}")
 
-def process_offline_csv_for_products(file_path, view_type='daily', operating_start_hour=0):
-    """Process offline CSV file for product quantity analysis"""
+def process_offline_csv_for_products(file_path, view_type='daily', operating_start_hour=0, start_date=None, end_date=None, hash_index=None, drilldown=None):
+    """Process offline CSV file(s) for product quantity analysis"""
     try:
-        df = pd.read_csv(file_path)
-        print(f"Offline CSV columns: {df.columns.tolist()}")
-
-        # Filter for sales and return transactions that are not cancelled
-        df = df[(df['Transaction Type'].isin(['Sale', 'Return'])) & (df['Is_Cancelled'] == False)]
-
-        # Filter rows with valid quantities and items
-        df = df[df['Quantity'].notna() & (df['Quantity'] > 0)]
-        df = df[df['Item'].notna() & (df['Item'].astype(str).str.strip() != '')]
-
-        # Clean item names
-        df['Item'] = df['Item'].astype(str).str.strip()
-
-        # Exclude service items
-        excluded_items = ['Service Charge', 'Discount', 'Tax']
-        df = df[~df['Item'].isin(excluded_items)]
-
-        # Create signed quantities: positive for sales, negative for returns
-        df['Signed_Quantity'] = df.apply(lambda row: row['Quantity'] if row['Transaction Type'] == 'Sale' else -row['Quantity'], axis=1)
-
-        # Parse dates/hours and apply operating hours logic
-        if view_type == 'hourly':
-            # Extract hour from Time for hourly grouping
-            df['Hour'] = df['Time'].apply(parse_time_to_hour)
-            df = df.dropna(subset=['Hour'])
-            # Group by hour and item, sum signed quantities (sales - returns)
-            product_data = df.groupby(['Hour', 'Item'])['Signed_Quantity'].sum().reset_index()
-            # Rename columns for consistency
-            product_data = product_data.rename(columns={'Hour': 'Date', 'Signed_Quantity': 'Quantity'})
-        else:
-            # Daily grouping (default)
-            df['Date'] = df['Time'].apply(lambda x: parse_time_to_date(x, operating_start_hour))
-            df = df.dropna(subset=['Date'])
-            # Group by date and item, sum signed quantities (sales - returns)
-            product_data = df.groupby(['Date', 'Item'])['Signed_Quantity'].sum().reset_index()
-            # Rename column for consistency
-            product_data = product_data.rename(columns={'Signed_Quantity': 'Quantity'})
-
+        partials = ingest_channel_files(as_path_list(file_path), 'offline',
+                                        lambda txns: aggregate_products(txns, view_type, operating_start_hour, start_date, end_date),
+                                        operating_start_hour, start_date, end_date, sales=False, hash_index=hash_index, drilldown=drilldown)
+        product_data = merge_product_frames(partials)
         print(f"Offline product data processed: {len(product_data)} records")
         return product_data
 
     except Exception as e:
         raise Exception(f"Error processing offline CSV for products: {str(e)}")
 
-def process_report_csv_for_products(file_path, view_type='daily'):
-    """Process report CSV file for product quantity analysis"""
+def process_report_csv_for_products(file_path, view_type='daily', start_date=None, end_date=None):
+    """Process report CSV file(s) for product quantity analysis"""
+    if not isinstance(file_path, str):
+        partials = map_files(lambda path: process_report_csv_for_products(path, view_type, start_date, end_date), file_path)
+        return pd.concat(partials, ignore_index=True) if partials else pd.DataFrame(columns=['Date', 'Item', 'Quantity'])
+
     try:
-        df = pd.read_csv(file_path)
+        df = read_csv_file(file_path, kind='report_products')
         print(f"Report CSV columns: {df.columns.tolist()}")
 
         # Parse dates/hours based on view type
@@ -537,13 +1633,23 @@ def process_report_csv_for_products(file_path, view_type='daily'):
             # Extract hour from Date/Time for hourly grouping
             df['Hour'] = df['Date / Time'].apply(parse_time_to_hour)
             df = df.dropna(subset=['Hour'])
+            df = filter_hourly_report_by_date_range(df, 'Date / Time', start_date, end_date)
             # Extract product data and clean item names
             product_data = df[['Hour', 'Product Name', 'Total Items Sold']].copy()
             product_data.columns = ['Date', 'Item', 'Quantity']  # Rename Hour to Date for consistency
+        elif view_type == 'matrix':
+            # Report date and hour of each row for the date x hour matrix
+            df['Date'] = df['Date / Time'].apply(parse_report_date)
+            df['Hour'] = df['Date / Time'].apply(parse_time_to_hour)
+            df = df.dropna(subset=['Date', 'Hour'])
+            df = filter_by_date_range(df, 'Date', start_date, end_date)
+            product_data = df[['Date', 'Hour', 'Product Name', 'Total Items Sold']].copy()
+            product_data.columns = ['Date', 'Hour', 'Item', 'Quantity']
         else:
             # Parse dates (report dates are already business dates)
             df['Date'] = df['Date / Time'].apply(parse_report_date)
             df = df.dropna(subset=['Date'])
+            df = filter_by_date_range(df, 'Date', start_date, end_date)
             # Extract product data and clean item names
             product_data = df[['Date', 'Product Name', 'Total Items Sold']].copy()
             product_data.columns = ['Date', 'Item', 'Quantity']
@@ -556,262 +1662,1320 @@ def process_report_csv_for_products(file_path, view_type='daily'):
     except Exception as e:
         raise Exception(f"Error processing report CSV for products: {str(e)}")
 
+def combine_sales_series(online_series, offline_series, report_series, view_type='daily'):
+    """Align online, offline and (optional) report series into one frame with a Total column"""
+    if view_type == 'daily':
+        # For daily view, we need to align dates from all series
+        all_dates = set()
+        if len(online_series) > 0:
+            all_dates.update(online_series.index)
+        if len(offline_series) > 0:
+            all_dates.update(offline_series.index)
+        if report_series is not None and len(report_series) > 0:
+            all_dates.update(report_series.index)
+
+        # Convert to sorted list
+        all_dates = sorted(list(all_dates))
+
+        # Create aligned series
+        online_aligned = pd.Series(0.0, index=all_dates)
+        offline_aligned = pd.Series(0.0, index=all_dates)
+
+        if len(online_series) > 0:
+            online_aligned.update(online_series)
+        if len(offline_series) > 0:
+            offline_aligned.update(offline_series)
+
+        df = pd.DataFrame({
+            'Online': online_aligned,
+            'Offline': offline_aligned,
+        })
+        df['Total'] = df['Online'] + df['Offline']
+
+        # Add report data if available
+        if report_series is not None:
+            report_aligned = pd.Series(0.0, index=all_dates)
+            if len(report_series) > 0:
+                report_aligned.update(report_series)
+            df['Report'] = report_aligned
+    else:
+        # For hourly view (existing logic)
+        df = pd.DataFrame({
+            'Online': online_series,
+            'Offline': offline_series,
+        })
+        df['Total'] = df['Online'] + df['Offline']
+
+        # Add report data if available
+        if report_series is not None:
+            df['Report'] = report_series
+
+    return df
+
+def iter_sales_rows(df, report_series, view_type='daily'):
+    """Yield one table row dict per date (daily) or hour (hourly) of a combined sales frame"""
+    if view_type == 'daily':
+        # Daily view - iterate through dates
+        target_dates = set()
+        if report_series is not None:
+            # Find dates that have non-zero report data
+            target_dates = set(report_series.index[report_series > 0]) & set(df.index)
+            print(f"Report dates detected: {sorted(target_dates)}")
+
+        has_report_column = report_series is not None and 'Report' in df.columns
+        values = zip(df.index, df['Online'].to_numpy(), df['Offline'].to_numpy(), df['Total'].to_numpy(),
+                     df['Report'].to_numpy() if has_report_column else np.zeros(len(df)))
+        for date_idx, online, offline, total, report in values:
+            row_data = {
+                'label': date_idx.strftime('%d %b %Y'),  # Format: "22 Aug 2025"
+                'bucket': drilldown_bucket_label(date_idx),
+                'online': float(online),
+                'offline': float(offline),
+                'total': float(total),
+                'show_in_report': date_idx in target_dates,
+                'has_discrepancy': False,
+                'report': 0.0,
+                'difference': 0.0
+            }
+
+            # Add report data and check for discrepancies if report is available
+            if has_report_column:
+                row_data['report'] = float(report)
+
+                # Calculate difference (Total - Report) for dates that have report data
+                if date_idx in target_dates:
+                    total_val = row_data['total']
+                    report_val = row_data['report']
+                    row_data['difference'] = total_val - report_val
+
+                    # Consider discrepancy if difference is more than 0.01
+                    if abs(row_data['difference']) > 0.01:
+                        row_data['has_discrepancy'] = True
+
+            yield row_data
+    else:
+        # Hourly view (existing logic)
+        target_hours = []
+        if report_series is not None:
+            # Find hours that have non-zero report data
+            target_hours = [h for h in range(24) if report_series[h] > 0]
+            print(f"Report hours detected: {target_hours}")
+
+        for h in range(24):
+            row_data = {
+                'label': format_hour_label(h),
+                'bucket': drilldown_bucket_label(h),
+                'online': float(df.at[h, 'Online']),
+                'offline': float(df.at[h, 'Offline']),
+                'total': float(df.at[h, 'Total']),
+                'show_in_report': h in target_hours,
+                'has_discrepancy': False,
+                'report': 0.0,
+                'difference': 0.0
+            }
+
+            # Add report data and check for discrepancies if report is available
+            if report_series is not None:
+                row_data['report'] = float(df.at[h, 'Report'])
+
+                # Calculate difference (Total - Report) for hours that have report data
+                if h in target_hours:
+                    total_val = row_data['total']
+                    report_val = row_data['report']
+                    row_data['difference'] = total_val - report_val
+
+                    # Consider discrepancy if difference is more than 0.01
+                    if abs(row_data['difference']) > 0.01:
+                        row_data['has_discrepancy'] = True
+
+            yield row_data
+
+def iter_sales_report_rows(online_series, offline_series, report_series, view_type='daily'):
+    """Yield the table rows of build_sales_report one at a time, for streamed exports"""
+    if view_type == 'matrix':
+        # At most 24 cells per date, built in one go
+        yield from build_sales_matrix(online_series, offline_series, report_series)[0]
+        return
+    df = combine_sales_series(online_series, offline_series, report_series, view_type)
+    yield from iter_sales_rows(df, report_series, view_type)
+
+def build_sales_report(online_series, offline_series, report_series, view_type='daily'):
+    """
+    Combine online, offline and report series into table rows and a footer.
+
+    report_series may be None when no report file was uploaded. The footer
+    returned here holds the sums; callers add the has_online/has_offline flags.
+    """
+    if view_type == 'matrix':
+        return build_sales_matrix(online_series, offline_series, report_series)
+
+    df = combine_sales_series(online_series, offline_series, report_series, view_type)
+    rows = list(iter_sales_rows(df, report_series, view_type))
+
+    # Calculate totals
+    footer = {
+        'online_sum': float(df['Online'].sum()),
+        'offline_sum': float(df['Offline'].sum()),
+        'total_sum': float(df['Total'].sum()),
+        'has_report': report_series is not None,
+        'view_type': view_type
+    }
+
+    if report_series is not None and 'Report' in df.columns:
+        footer['report_sum'] = float(df['Report'].sum())
+        footer['difference_sum'] = footer['total_sum'] - footer['report_sum']
+
+    return rows, footer
+
+def combine_product_frames(online_products, offline_products, report_products):
+    """
+    Sum each product frame per (Date, Item) and align them side by side.
+
+    Returns a frame indexed by (Date, Item) with online/offline/report columns,
+    NaN where a source has no row for that combination.
+    """
+    parts = []
+    for source, df in [('online', online_products), ('offline', offline_products), ('report', report_products)]:
+        if len(df) == 0:
+            continue
+        part = df[['Date', 'Item', 'Quantity']].copy()
+        # Ensure both date and item are valid
+        part = part[part['Date'].notna() & part['Item'].notna()]
+        part['Item'] = part['Item'].astype(str).str.strip()
+        part = part[part['Item'] != '']
+        part['Source'] = source
+        parts.append(part)
+
+    if not parts:
+        return pd.DataFrame(columns=['online', 'offline', 'report'])
+
+    combined = pd.concat(parts, ignore_index=True)
+    table = combined.groupby(['Date', 'Item', 'Source'])['Quantity'].sum().unstack('Source')
+    return table.reindex(columns=['online', 'offline', 'report'])
+
+def iter_product_rows(online_products, offline_products, report_products, view_type='daily'):
+    """Yield one table row dict per date/hour and product, sorted by date then item name"""
+    if view_type == 'matrix':
+        yield from build_product_matrix(online_products, offline_products, report_products)[0]
+        return
+
+    table = combine_product_frames(online_products, offline_products, report_products).reset_index()
+    if len(table) == 0:
+        return
+
+    # Sort combinations by date first, then by item name
+    table['Sort Item'] = table['Item'].str.lower()
+    table = table.sort_values(['Date', 'Sort Item'], kind='mergesort')
+
+    # Plain arrays, so no per-row dict or Series is built before the first row is yielded
+    values = zip(table['Date'].to_numpy(), table['Item'].to_numpy(),
+                 table['online'].to_numpy(), table['offline'].to_numpy(), table['report'].to_numpy())
+    for date, item, online, offline, report in values:
+        # Quantities for this date-item combination (0 when a source has none)
+        online_qty = round(float(online), 2) if pd.notna(online) else 0
+        offline_qty = round(float(offline), 2) if pd.notna(offline) else 0
+        report_qty = round(float(report), 2) if pd.notna(report) else 0
+
+        total_qty = online_qty + offline_qty
+        difference = total_qty - report_qty
+
+        # Format date/time based on view type
+        if view_type == 'hourly':
+            # For hourly view, date is actually an hour (0-23)
+            if float(date).is_integer():
+                date_label = format_hour_label(int(date))
+            else:
+                date_label = str(date)
+        else:
+            # For daily view, format as date
+            date_label = date.strftime('%d %b %Y')
+
+        yield {
+            'date': date_label,
+            'bucket': drilldown_bucket_label(date),
+            'product_name': item,
+            'online': online_qty,
+            'offline': offline_qty,
+            'total': total_qty,
+            'report': report_qty,
+            'difference': difference,
+            'show_in_report': report_qty > 0,
+            'has_discrepancy': abs(difference) > 0 and report_qty > 0
+        }
+
+def build_product_report(online_products, offline_products, report_products, view_type='daily', has_report=False):
+    """
+    Combine online, offline and report product frames into table rows and a footer.
+
+    Each frame has Date, Item and Quantity columns. The footer returned here
+    holds the sums; callers add the has_online/has_offline flags.
+    """
+    if view_type == 'matrix':
+        return build_product_matrix(online_products, offline_products, report_products, has_report)
+
+    rows = list(iter_product_rows(online_products, offline_products, report_products, view_type))
+
+    # Calculate totals
+    footer = {
+        'online_sum': sum(row['online'] for row in rows),
+        'offline_sum': sum(row['offline'] for row in rows),
+        'total_sum': sum(row['total'] for row in rows),
+        'report_sum': sum(row['report'] for row in rows),
+        'difference_sum': sum(row['total'] for row in rows) - sum(row['report'] for row in rows),
+        'has_report': has_report,
+        'view_type': view_type
+    }
+
+    return rows, footer
+
+# Per-cell values of compared date x hour matrices, in the order rows and exports use them
+MATRIX_VALUES = ['online', 'offline', 'total', 'report', 'difference', 'show_in_report', 'has_discrepancy']
+
+def compare_matrices(online_matrix, offline_matrix, report_matrix=None, tolerance=0.0):
+    """
+    Reconcile date x hour matrices cell by cell.
+
+    All matrices are aligned on the union of their rows and on the 24 hours, so
+    totals, differences and discrepancy flags are computed as whole-frame
+    arithmetic. As in the other views, a cell is only compared when the report
+    has a positive value there. Returns {name: frame} for MATRIX_VALUES.
+    """
+    index = online_matrix.index.union(offline_matrix.index)
+    if report_matrix is not None:
+        index = index.union(report_matrix.index)
+
+    def align(matrix):
+        return matrix.reindex(index=index, columns=range(24), fill_value=0.0)
+
+    matrices = {'online': align(online_matrix), 'offline': align(offline_matrix)}
+    matrices['total'] = matrices['online'] + matrices['offline']
+    matrices['report'] = align(report_matrix) if report_matrix is not None else matrices['total'] * 0.0
+    matrices['show_in_report'] = matrices['report'] > 0
+    matrices['difference'] = (matrices['total'] - matrices['report']).where(matrices['show_in_report'], 0.0)
+    matrices['has_discrepancy'] = matrices['show_in_report'] & (matrices['difference'].abs() > tolerance)
+    return matrices
+
+def iter_matrix_rows(matrices, row_fields):
+    """
+    Yield one table row dict per row of compared matrices, with one cell dict per hour.
+
+    row_fields(key) returns the row's own fields (label, product name...) and
+    its date, used for the drill-down bucket of each cell.
+    """
+    values = {name: matrices[name].to_numpy() for name in MATRIX_VALUES}
+    for position, key in enumerate(matrices['total'].index):
+        row, date = row_fields(key)
+        cells = []
+        for hour in range(24):
+            cell = {name: values[name][position, hour].item() for name in MATRIX_VALUES}
+            cell.update(hour=hour, hour_label=format_hour_label(hour), bucket=drilldown_bucket_label((date, hour)))
+            cells.append(cell)
+
+        shown = values['show_in_report'][position]
+        row.update({
+            'online': round(float(values['online'][position].sum()), 2),
+            'offline': round(float(values['offline'][position].sum()), 2),
+            'total': round(float(values['total'][position].sum()), 2),
+            'report': round(float(values['report'][position].sum()), 2),
+            'difference': round(float(values['difference'][position].sum()), 2),
+            'show_in_report': bool(shown.any()),
+            'has_discrepancy': bool(values['has_discrepancy'][position].any()),
+            'cells': cells,
+        })
+        yield row
+
+def matrix_footer(matrices, has_report):
+    """Sums of compared matrices, plus the hours worth a column and their totals"""
+    total = matrices['total'].to_numpy()
+    active = (matrices['online'].to_numpy() != 0) | (matrices['offline'].to_numpy() != 0) | matrices['show_in_report'].to_numpy()
+    hours = [hour for hour in range(24) if active[:, hour].any()]
+    footer = {
+        'online_sum': float(matrices['online'].to_numpy().sum()),
+        'offline_sum': float(matrices['offline'].to_numpy().sum()),
+        'total_sum': float(total.sum()),
+        'report_sum': float(matrices['report'].to_numpy().sum()),
+        'has_report': has_report,
+        'view_type': 'matrix',
+        'hours': [{'hour': hour, 'label': format_hour_label(hour), 'total': float(total[:, hour].sum())} for hour in hours],
+    }
+    footer['difference_sum'] = footer['total_sum'] - footer['report_sum']
+    return footer
+
+def build_sales_matrix(online_matrix, offline_matrix, report_matrix=None):
+    """
+    Table rows (one per business date) and footer of the date x hour sales view.
+
+    Each argument is a date x hour matrix from process_*_csv with view_type='matrix';
+    report_matrix is None when no report file was uploaded.
+    """
+    matrices = compare_matrices(online_matrix, offline_matrix, report_matrix, tolerance=0.01)
+    rows = list(iter_matrix_rows(matrices, lambda date: ({'label': date.strftime('%d %b %Y'), 'bucket': drilldown_bucket_label(date)}, date)))
+    return rows, matrix_footer(matrices, report_matrix is not None)
+
+def product_matrix(products):
+    """Date x hour matrix of a product frame (Date, Hour, Item, Quantity), one row per date and item"""
+    if len(products) > 0 and 'Hour' in products.columns:
+        products = products[products['Date'].notna() & products['Item'].notna()].copy()
+        products['Item'] = products['Item'].astype(str).str.strip()
+        products = products[products['Item'] != '']
+    return pivot_hours(products, ['Date', 'Item'], 'Quantity').round(2)
+
+def build_product_matrix(online_products, offline_products, report_products, has_report=False):
+    """Table rows (one per date and product, sorted like the other views) and footer of the date x hour product view"""
+    matrices = compare_matrices(product_matrix(online_products), product_matrix(offline_products), product_matrix(report_products))
+    order = sorted(range(len(matrices['total'].index)), key=lambda i: (matrices['total'].index[i][0], matrices['total'].index[i][1].lower()))
+    matrices = {name: matrix.iloc[order] for name, matrix in matrices.items()}
+
+    def row_fields(key):
+        date, item = key
+        return {'date': date.strftime('%d %b %Y'), 'bucket': drilldown_bucket_label(date), 'product_name': item}, date
+
+    rows = list(iter_matrix_rows(matrices, row_fields))
+    return rows, matrix_footer(matrices, has_report)
+
+def iter_matrix_cells(rows, label_key):
+    """Flatten matrix rows into one export row per date and hour with any online, offline or report value"""
+    for row in rows:
+        for cell in row['cells']:
+            if cell['online'] == 0 and cell['offline'] == 0 and not cell['show_in_report']:
+                continue
+            record = {key: value for key, value in row.items() if key != 'cells'}
+            record.update({name: cell[name] for name in MATRIX_VALUES})
+            record[label_key] = f"{row[label_key]} {cell['hour_label']}"
+            yield record
+
+# Columns written by the CSV/XLSX exports: (row key, header) per report
+SALES_EXPORT_COLUMNS = [('label', 'Date'), ('online', 'Online'), ('offline', 'Offline'), ('total', 'Total'),
+                        ('report', 'Report'), ('difference', 'Difference')]
+PRODUCT_EXPORT_COLUMNS = [('date', 'Date'), ('product_name', 'Product Name'), ('online', 'Online (Qty)'),
+                          ('offline', 'Offline (Qty)'), ('total', 'Total (Qty)'), ('report', 'Report (Qty)'),
+                          ('difference', 'Difference')]
+EXPORT_FORMATS = {'csv', 'xlsx'}
+EXPORT_FLUSH_ROWS = 1000
+
+def iter_export_records(rows, columns, has_report, view_type='daily'):
+    """
+    Yield the header, one list per table row, then the footer row.
+
+    Rows are consumed one at a time and the footer sums are accumulated on the
+    way, so a generator of rows is never materialized.
+    """
+    if not has_report:
+        columns = [(key, title) for key, title in columns if key not in ('report', 'difference')]
+    header = [title for _, title in columns]
+    if view_type == 'hourly':
+        header[0] = 'Time'
+    elif view_type == 'matrix':
+        header[0] = 'Date / Time'
+    if has_report:
+        header.append('Discrepancy')
+    yield header
+
+    sums = {'online': 0.0, 'offline': 0.0, 'total': 0.0, 'report': 0.0}
+    for row in rows:
+        for key in sums:
+            sums[key] += float(row[key])
+
+        record = []
+        for key, _ in columns:
+            value = row[key]
+            if key in ('report', 'difference') and not row['show_in_report']:
+                value = ''
+            elif key in sums or key == 'difference':
+                value = round(float(value), 2)
+            record.append(value)
+        if has_report:
+            record.append('Yes' if row['has_discrepancy'] else '')
+        yield record
+
+    sums['difference'] = sums['total'] - sums['report']
+    footer = ['Total'] + [round(sums[key], 2) if key in sums else '' for key, _ in columns[1:]]
+    if has_report:
+        footer.append('')
+    yield footer
+
+def stream_csv(records):
+    """Encode records as CSV, yielding the header at once and then every EXPORT_FLUSH_ROWS rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for count, record in enumerate(records):
+        writer.writerow(record)
+        if count % EXPORT_FLUSH_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def stream_xlsx(records, sheet_title):
+    """
+    Write records with openpyxl's write-only workbook and stream the file.
+
+    Rows go straight to the worksheet's temporary XML, so memory stays flat;
+    the zipped workbook is spooled to disk and sent in 64KB chunks.
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title=sheet_title)
+    for record in records:
+        sheet.append(record)
+
+    output = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    workbook.save(output)
+    output.seek(0)
+    try:
+        while True:
+            chunk = output.read(64 * 1024)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        output.close()
+
+def guard_stream(chunks, name):
+    """
+    Pass a response body through, logging an error raised mid-stream.
+
+    The route's try/except has already returned by then, so the download just
+    ends early; a CSV cut short has no Total row.
+    """
+    try:
+        yield from chunks
+    except Exception as e:
+        print(f"❌ Error streaming {name} export: {str(e)}")
+
+def export_response(rows, columns, has_report, view_type, export_format, name):
+    """Stream reconciled rows as a CSV or XLSX download"""
+    if view_type == 'matrix':
+        # One line per date and hour, so the export stays a flat table
+        rows = iter_matrix_cells(rows, columns[0][0])
+    records = iter_export_records(rows, columns, has_report, view_type)
+    if export_format == 'xlsx':
+        if Workbook is None:
+            raise Exception("XLSX export requires the openpyxl package")
+        body = stream_xlsx(records, name)
+        mimetype = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    else:
+        body = stream_csv(records)
+        mimetype = 'text/csv'
+
+    filename = f"{name}_{view_type}.{export_format}"
+    return Response(guard_stream(body, name), mimetype=mimetype, headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+# Kinds of file the ingest service recognises, checked in this order by classify_csv
+INGEST_KINDS = ['online', 'offline', 'report_products', 'report']
+INGEST_AGGREGATE_KEYS = {
+    'sales': ['Date', 'DateHour', 'Hour'],
+    'products': ['Date', 'DateHour', 'Hour', 'Item'],
+}
+
+def classify_csv(file_path):
+    """
+    Tell an online, offline, sales report or product report export apart by its header.
+
+    Returns one of INGEST_KINDS, or None when the header matches none of them.
+    """
+    try:
+        columns = list(read_file_sample(file_path, 0).columns)
+    except Exception:
+        return None
+    for channel in TRANSACTION_HEADER_COLUMNS:
+        renamed = [reconcile_headers(columns, channel).get(col, col) for col in columns]
+        if all(col in renamed for col in CSV_SCHEMAS[channel]['required']):
+            return channel
+    if all(col in columns for col in CSV_SCHEMAS['report_products']['required']):
+        return 'report_products'
+    if len(columns) >= 2:
+        return 'report'
+    return None
+
+def file_content_hash(file_path):
+    """SHA-256 of a file's contents, read in 1MB blocks"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def transaction_time_buckets(times):
+    """
+    Calendar date, the hour used for the business date, and hour of day of each timestamp.
+
+    Any operating start hour can be applied later: the business date is Date,
+    or the day before when DateHour is earlier than the start hour.
+    """
+    parsed = parse_timestamps_vectorized(times, fallback=True)
+    return pd.DataFrame({
+        'Date': parsed.dt.normalize(),
+        'DateHour': parsed.dt.hour,
+        'Hour': timestamp_values(times, dates=False)[1],
+    }, index=times.index)
+
+def compute_file_aggregates(file_path, kind):
+    """
+    Parse one file once with the usual rules into partial aggregates.
+
+    Transactions are summed per (calendar date, date hour, hour of day[, item]),
+    which is fine enough to roll up to any view, operating start hour or date
+    range later. Reports are summed per (report date, hour[, item]).
+    """
+    aggregates = {}
+    if kind in TRANSACTION_HEADER_COLUMNS:
+        problems = {part: preflight_csv(file_path, kind if part == 'sales' else f'{kind}_products')
+                    for part in ('sales', 'products')}
+        sales = not problems['sales']
+        products = not problems['products']
+        if not sales and not products:
+            raise ValueError('; '.join(problems['sales'] + problems['products']))
+
+        df = read_channel_file(file_path, kind, keep_missing_time=True)
+        txns = TRANSACTION_SOURCES[kind][1](df, sales=sales, products=products)
+        if sales:
+            frame = transaction_time_buckets(txns['Sales Time'])
+            frame['Total'] = txns['Total']
+            frame = frame[txns['In Sales']]
+            aggregates['sales'] = frame.groupby(INGEST_AGGREGATE_KEYS['sales'], dropna=False)['Total'].sum().reset_index()
+        if products:
+            frame = transaction_time_buckets(txns['Product Time'])
+            frame['Item'] = txns['Item']
+            frame['Quantity'] = txns['Quantity']
+            frame = frame[txns['In Products']]
+            aggregates['products'] = frame.groupby(INGEST_AGGREGATE_KEYS['products'], dropna=False)['Quantity'].sum().reset_index()
+        aggregates['rows'] = len(df)
+        return aggregates
+
+    # Daily reports carry dates and hourly ones hours; keep only the keys the file really has
+    problems = {view_type: preflight_csv(file_path, kind, view_type) for view_type in ('daily', 'hourly')}
+    if problems['daily'] and problems['hourly']:
+        raise ValueError('; '.join(problems['daily']))
+    df = read_csv_file(file_path, kind=kind)
+    if kind == 'report_products':
+        time_col, item_col, value_col = 'Date / Time', 'Product Name', 'Total Items Sold'
+    else:
+        (time_col, value_col), item_col = detect_report_columns(df.columns), None
+    frame = pd.DataFrame({
+        'Date': pd.to_datetime(df[time_col].apply(report_row_date)),
+        'Hour': df[time_col].apply(parse_time_to_hour).astype(float),
+        'Value': df[value_col],
+    })
+    if problems['daily']:
+        frame['Date'] = pd.NaT
+    if problems['hourly']:
+        frame['Hour'] = np.nan
+    if item_col:
+        frame['Item'] = df[item_col].astype(str).str.strip()
+    aggregates['report'] = frame.groupby([col for col in ['Date', 'Hour', 'Item'] if col in frame.columns], dropna=False)['Value'].sum().reset_index()
+    aggregates['rows'] = len(df)
+    return aggregates
+
+def ingest_store_path(*parts):
+    return os.path.join(app.config['INGEST_STORE_DIR'], *parts)
+
+def load_ingest_manifest():
+    """The ingest service's record of every file it has seen, keyed by content hash"""
+    try:
+        with open(ingest_store_path('manifest.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'files': {}, 'paths': {}}
+
+def write_atomically(path, data):
+    """Write bytes to path through a temporary file so readers never see a partial file"""
+    tmp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def frame_to_json(df):
+    """Columns of df as plain lists plus their dtypes; json writes floats with repr, so sums round-trip exactly"""
+    data = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime('%Y-%m-%dT%H:%M:%S')
+        data[col] = [None if pd.isna(value) else value for value in values.tolist()]
+    return {'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()}, 'data': data}
+
+def frame_from_json(encoded):
+    df = pd.DataFrame(encoded['data'], columns=list(encoded['dtypes']))
+    for col, dtype in encoded['dtypes'].items():
+        df[col] = pd.to_datetime(df[col]) if dtype.startswith('datetime64') else df[col].astype(dtype)
+    return df
+
+def aggregates_to_json(aggregates):
+    """Encode compute_file_aggregates output as JSON"""
+    encoded = {key: frame_to_json(value) if isinstance(value, pd.DataFrame) else value for key, value in aggregates.items()}
+    return json.dumps(encoded).encode('utf-8')
+
+def aggregates_from_json(data):
+    """Inverse of aggregates_to_json; only data is read back, never code"""
+    return {key: frame_from_json(value) if isinstance(value, dict) else value for key, value in json.loads(data).items()}
+
+def ingest_file(file_path, manifest):
+    """
+    Ingest one dropped file into the store unless its contents were seen before.
+
+    manifest is updated in place (the caller saves it). Files are remembered by
+    path, size and mtime too, so unchanged files are not even re-hashed after a
+    restart. Returns the manifest entry of the file.
+    """
+    def stored(content_hash):
+        # Stores written before aggregates were kept as JSON are ingested again
+        entry = manifest['files'].get(content_hash)
+        return entry is not None and (entry['status'] != 'ok' or os.path.exists(ingest_store_path('aggregates', f'{content_hash}.json')))
+
+    stat = os.stat(file_path)
+    signature = [stat.st_size, stat.st_mtime_ns]
+    known = manifest['paths'].get(file_path)
+    if known and known['signature'] == signature and stored(known['hash']):
+        return manifest['files'][known['hash']]
+
+    content_hash = file_content_hash(file_path)
+    manifest['paths'][file_path] = {'signature': signature, 'hash': content_hash}
+    if stored(content_hash):
+        print(f"⏭️ {file_path}: already ingested as {manifest['files'][content_hash]['name']}")
+        return manifest['files'][content_hash]
+
+    entry = {'name': os.path.basename(file_path), 'kind': classify_csv(file_path),
+             'ingested_at': datetime.now().isoformat(timespec='seconds')}
+    if entry['kind'] is None:
+        entry.update(status='skipped', error='header matches no known export')
+    else:
+        try:
+            aggregates = compute_file_aggregates(file_path, entry['kind'])
+            os.makedirs(ingest_store_path('aggregates'), exist_ok=True)
+            write_atomically(ingest_store_path('aggregates', f'{content_hash}.json'), aggregates_to_json(aggregates))
+            entry.update(status='ok', rows=aggregates['rows'])
+        except Exception as e:
+            entry.update(status='error', error=str(e))
+    manifest['files'][content_hash] = entry
+    print(f"{'✅' if entry['status'] == 'ok' else '⚠️'} {file_path}: {entry['kind']} {entry['status']} {entry.get('error', '')}")
+    return entry
+
+def save_ingest_manifest(manifest):
+    os.makedirs(app.config['INGEST_STORE_DIR'], exist_ok=True)
+    write_atomically(ingest_store_path('manifest.json'), json.dumps(manifest, indent=1).encode('utf-8'))
+
+# Aggregates of every ingested file, reloaded only when the manifest changes
+ingested_cache = {'mtime': None, 'data': None}
+ingested_cache_lock = threading.Lock()
+
+def load_ingested_aggregates():
+    """
+    Return {'files': [...], (kind, part): DataFrame} for all successfully ingested files.
+
+    Parts of the same kind are concatenated once and kept in memory until the
+    ingest service writes a new manifest, so the views roll them up instantly.
+    """
+    try:
+        mtime = os.path.getmtime(ingest_store_path('manifest.json'))
+    except OSError:
+        return {'files': []}
+    with ingested_cache_lock:
+        if ingested_cache['mtime'] == mtime:
+            return ingested_cache['data']
+
+        files = []
+        parts = {}
+        for content_hash, entry in load_ingest_manifest()['files'].items():
+            if entry.get('status') != 'ok':
+                continue
+            try:
+                with open(ingest_store_path('aggregates', f'{content_hash}.json'), 'rb') as f:
+                    aggregates = aggregates_from_json(f.read())
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Skipping stored aggregates of {entry.get('name')}: {str(e)}")
+                continue
+            files.append(entry)
+            for part in ('sales', 'products', 'report'):
+                if part in aggregates:
+                    parts.setdefault((entry['kind'], part), []).append(aggregates[part])
+
+        data = {'files': files}
+        for key, frames in parts.items():
+            data[key] = pd.concat(frames, ignore_index=True)
+        ingested_cache.update(mtime=mtime, data=data)
+        return data
+
+def ingested_report(ingested, kind, view_type='daily'):
+    """Ingested report aggregates usable in the given view, or None when no report has those keys"""
+    frame = ingested.get((kind, 'report'))
+    if frame is None:
+        return None
+    keys = {'daily': ['Date'], 'hourly': ['Hour'], 'matrix': ['Date', 'Hour']}[view_type]
+    frame = frame[frame[keys].notna().all(axis=1)]
+    return frame if len(frame) else None
+
+def ingested_business_dates(frame, operating_start_hour=0):
+    """Business date of each aggregate row for the given operating start hour (NaT if undated)"""
+    before_start = (frame['DateHour'] < operating_start_hour).astype(int)
+    return frame['Date'] - pd.to_timedelta(before_start, unit='D')
+
+def ingested_date_mask(dates, start_date=None, end_date=None):
+    mask = dates.notna()
+    if start_date is not None:
+        mask &= dates >= pd.Timestamp(start_date)
+    if end_date is not None:
+        mask &= dates <= pd.Timestamp(end_date)
+    return mask
+
+def ingested_sales_series(frame, view_type='daily', operating_start_hour=0, start_date=None, end_date=None, report=False):
+    """Roll ingested sales (or sales report) aggregates up to the series process_*_csv would return"""
+    if frame is None or len(frame) == 0:
+        return empty_sales_series(view_type)
+    value_col = 'Value' if report else 'Total'
+    dates = frame['Date'] if report else ingested_business_dates(frame, operating_start_hour)
+    in_range = ingested_date_mask(dates, start_date, end_date)
+
+    if view_type == 'daily':
+        selected = frame[in_range]
+        return selected.groupby(dates[in_range].dt.date)[value_col].sum()
+    if view_type == 'matrix':
+        mask = in_range & frame['Hour'].notna()
+        return pivot_hours(frame[mask].assign(Date=dates[mask].dt.date), ['Date'], value_col)
+
+    # Hourly: unranged uploads and report rows without a date are kept, as the upload path does
+    mask = frame['Hour'].notna()
+    if start_date is not None or end_date is not None:
+        mask &= (in_range | dates.isna()) if report else in_range
+    selected = frame[mask]
+    result = pd.Series(0.0, index=range(24))
+    result.update(selected.groupby(selected['Hour'].astype(int))[value_col].sum())
+    return result
+
+def ingested_product_frame(frame, view_type='daily', operating_start_hour=0, start_date=None, end_date=None, hourly_requires_date=False, report=False):
+    """Roll ingested product aggregates up to the frame process_*_csv_for_products would return"""
+    if frame is None or len(frame) == 0:
+        return pd.DataFrame(columns=['Date', 'Item', 'Quantity'])
+    value_col = 'Value' if report else 'Quantity'
+    dates = frame['Date'] if report else ingested_business_dates(frame, operating_start_hour)
+    in_range = ingested_date_mask(dates, start_date, end_date)
+
+    if view_type == 'daily':
+        selected = frame[in_range]
+        keys = [dates[in_range].dt.date.rename('Date'), selected['Item']]
+    elif view_type == 'matrix':
+        mask = in_range & frame['Hour'].notna()
+        selected = frame[mask]
+        keys = [dates[mask].dt.date.rename('Date'), selected['Hour'].astype(int), selected['Item']]
+    else:
+        mask = frame['Hour'].notna()
+        if report and (start_date is not None or end_date is not None):
+            mask &= in_range | dates.isna()
+        elif not report and (hourly_requires_date or start_date is not None or end_date is not None):
+            mask &= in_range
+        selected = frame[mask]
+        keys = [selected['Hour'].astype(int).rename('Date'), selected['Item']]
+    return selected.groupby(keys)[value_col].sum().rename('Quantity').reset_index()
+
+class AdmissionRejected(Exception):
+    """Raised when a heavy upload cannot get a parse slot in time"""
+
+class AdmissionController:
+    """
+    Limit how many heavy uploads are parsed at once.
+
+    Uploads of at least heavy_bytes must hold a per-worker slot (a semaphore
+    shared by the worker's threads) and a per-host slot (one of max_per_host
+    flock()ed files shared by every gunicorn worker). At most max_queued heavy
+    requests per worker wait for slots, each for up to wait_seconds; beyond
+    that they are rejected at once. Smaller uploads and page loads skip the
+    queue entirely.
+    """
+
+    def __init__(self, heavy_bytes, max_per_worker, max_per_host, max_queued, wait_seconds, lock_dir):
+        self.heavy_bytes = heavy_bytes
+        self.max_per_host = max_per_host
+        self.max_queued = max_queued
+        self.wait_seconds = wait_seconds
+        self.lock_dir = lock_dir
+        self.worker_slots = threading.BoundedSemaphore(max_per_worker)
+        self.queue_lock = threading.Lock()
+        self.waiting = 0
+
+    def acquire_host_slot(self, deadline):
+        """Lock one of the host-wide slot files, polling until the deadline (None if unavailable)"""
+        if fcntl is None:
+            return 'unlimited'  # flock() is not available on this platform
+        os.makedirs(self.lock_dir, exist_ok=True)
+        while True:
+            for slot in range(self.max_per_host):
+                handle = open(os.path.join(self.lock_dir, f'slot-{slot}.lock'), 'w')
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return handle
+                except OSError:
+                    handle.close()
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
+
+    def is_heavy(self, method, content_length):
+        """Only POSTs whose body is at least heavy_bytes need a slot; page loads never do"""
+        return method == 'POST' and content_length is not None and content_length >= self.heavy_bytes
+
+    def admit(self):
+        """
+        Wait for a worker slot and a host slot and return a function releasing both.
+
+        Raises AdmissionRejected when the queue is full or no slot frees up in time.
+        """
+        with self.queue_lock:
+            if self.waiting >= self.max_queued:
+                raise AdmissionRejected("upload queue is full")
+            self.waiting += 1
+
+        deadline = time.monotonic() + self.wait_seconds
+        host_slot = None
+        try:
+            if not self.worker_slots.acquire(timeout=self.wait_seconds):
+                raise AdmissionRejected("timed out waiting for a worker parse slot")
+            host_slot = self.acquire_host_slot(deadline)
+            if host_slot is None:
+                self.worker_slots.release()
+                raise AdmissionRejected("timed out waiting for a host parse slot")
+        finally:
+            with self.queue_lock:
+                self.waiting -= 1
+
+        released = []
+
+        def release():
+            # Safe to call twice (e.g. a close after an error)
+            if released:
+                return
+            released.append(True)
+            if host_slot != 'unlimited':
+                host_slot.close()  # Closing the file releases the flock
+            self.worker_slots.release()
+
+        return release
+
+admission = AdmissionController(
+    heavy_bytes=app.config['HEAVY_UPLOAD_BYTES'],
+    max_per_worker=app.config['MAX_HEAVY_PARSES_PER_WORKER'],
+    max_per_host=app.config['MAX_HEAVY_PARSES_PER_HOST'],
+    max_queued=app.config['MAX_QUEUED_HEAVY_UPLOADS'],
+    wait_seconds=app.config['ADMISSION_WAIT_SECONDS'],
+    lock_dir=os.path.join(UPLOAD_FOLDER, '.admission'),
+)
+
+def admission_controlled(template):
+    """
+    Run a view under the admission controller.
+
+    When no parse slot frees up in time the page is re-rendered with an error
+    and a 503 status carrying Retry-After, instead of queueing indefinitely.
+    A streamed download keeps its slot until the body has been sent, since
+    its rows are still being parsed and aggregated while it streams.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not admission.is_heavy(request.method, request.content_length):
+                return view(*args, **kwargs)
+            try:
+                release = admission.admit()
+            except AdmissionRejected as e:
+                print(f"⏳ Rejected {request.path} ({request.content_length} bytes): {str(e)}")
+                retry_after = app.config['ADMISSION_RETRY_AFTER_SECONDS']
+                flash(f'The server is busy processing other large uploads. Please try again in {retry_after} seconds.', 'error')
+                page = render_template(template, rows=[], footer=None, has_result=False, view_type='daily')
+                return page, 503, {'Retry-After': str(retry_after)}
+
+            try:
+                response = app.make_response(view(*args, **kwargs))
+            except BaseException:
+                release()
+                raise
+            if response.is_streamed:
+                response.call_on_close(release)
+            else:
+                release()
+            return response
+        return wrapper
+    return decorator
+
 @app.route('/')
 def index():
     """Homepage with navigation options"""
     return render_template('index.html')
 
 @app.route('/salesovertime', methods=['GET', 'POST'])
+@admission_controlled('salesovertime.html')
 def salesovertime():
     """Sales Overtime Report functionality"""
     if request.method == 'POST':
-        # Get uploaded files
-        online_file = request.files.get('online_csv')
-        offline_file = request.files.get('offline_csv')
-        report_file = request.files.get('report_csv')
+        return handle_salesovertime_upload()
 
-        # Get view selection (default to daily)
-        view_type = request.form.get('view_type', 'daily')
-        print(f"Selected view type: {view_type}")
+    # GET request
+    return render_template('salesovertime.html', rows=[], footer=None, has_result=False, view_type='daily')
 
-        # Get operating hours (default to 00:00 if not provided)
-        operating_hours_str = request.form.get('operating_hours', '00:00')
-        operating_start_hour = parse_operating_hours(operating_hours_str)
-        print(f"Operating hours: {operating_hours_str} -> Start hour: {operating_start_hour}")
+@app.route('/salesovertime/export/<export_format>', methods=['POST'])
+@admission_controlled('salesovertime.html')
+def salesovertime_export(export_format):
+    """Download the Sales Overtime reconciliation as CSV or XLSX"""
+    if export_format not in EXPORT_FORMATS:
+        abort(404)
+    return handle_salesovertime_upload(export_format)
+
+@app.route('/salesovertime/ingested')
+def salesovertime_ingested():
+    """Sales Overtime Report over the files precomputed by the ingest service"""
+    view_type = request.args.get('view_type', 'daily')
+    operating_start_hour = parse_operating_hours(request.args.get('operating_hours', '00:00'))
+    start_date = parse_date_input(request.args.get('start_date'))
+    end_date = parse_date_input(request.args.get('end_date'))
+
+    ingested = load_ingested_aggregates()
+    online = ingested.get(('online', 'sales'))
+    offline = ingested.get(('offline', 'sales'))
+    report = ingested_report(ingested, 'report', view_type)
+    if online is None and offline is None:
+        flash('No online or offline files have been ingested yet.', 'error')
+        return redirect(url_for('salesovertime'))
+
+    online_series = ingested_sales_series(online, view_type, operating_start_hour, start_date, end_date)
+    offline_series = ingested_sales_series(offline, view_type, operating_start_hour, start_date, end_date)
+    report_series = None if report is None else ingested_sales_series(report, view_type, start_date=start_date, end_date=end_date, report=True)
+
+    rows, footer = build_sales_report(online_series, offline_series, report_series, view_type)
+    footer.update({
+        'has_online': online is not None,
+        'has_offline': offline is not None,
+        'start_date': start_date,
+        'end_date': end_date,
+        'ingested_files': len(ingested['files']),
+    })
+    return render_template('salesovertime.html', rows=rows, footer=footer, has_result=True, view_type=view_type)
+
+def handle_salesovertime_upload(export_format=None):
+    """Process a Sales Overtime upload and render it, or stream it when export_format is set"""
+    # Get uploaded files
+    online_files = [f for f in request.files.getlist('online_csv') if f]
+    offline_files = [f for f in request.files.getlist('offline_csv') if f]
+    report_files = [f for f in request.files.getlist('report_csv') if f]
+
+    # Get view selection (default to daily)
+    view_type = request.form.get('view_type', 'daily')
+    print(f"Selected view type: {view_type}")
+
+    # Get operating hours (default to 00:00 if not provided)
+    operating_hours_str = request.form.get('operating_hours', '00:00')
+    operating_start_hour = parse_operating_hours(operating_hours_str)
+    print(f"Operating hours: {operating_hours_str} -> Start hour: {operating_start_hour}")
+
+    # Get optional business date range (inclusive)
+    start_date = parse_date_input(request.form.get('start_date'))
+    end_date = parse_date_input(request.form.get('end_date'))
+    print(f"Date range: {start_date} - {end_date}")
+
+    # Drop lines repeated from an earlier file of the same channel (opt-in checkbox); repeats within one file are kept
+    dedupe = request.form.get('dedupe') == 'on'
+    online_index = TransactionHashIndex('online') if dedupe else None
+    offline_index = TransactionHashIndex('offline') if dedupe else None
+
+    # Validate that at least one file is uploaded
+    if not online_files and not offline_files:
+        flash('Please upload at least one CSV file (Online or Offline).', 'error')
+        return redirect(url_for('index'))
+
+    if start_date and end_date and start_date > end_date:
+        flash('Start date must be on or before end date.', 'error')
+        return redirect(url_for('salesovertime'))
+
+    # Validate file extensions for uploaded files
+    files_to_check = online_files + offline_files + report_files
+    if not all(allowed_file(f.filename) for f in files_to_check):
+        flash('Only .csv and .xlsx files are supported.', 'error')
+        return redirect(url_for('index'))
+
+    # Save uploaded files
+    online_paths = [save_upload(f, 'online.csv') for f in online_files]
+    offline_paths = [save_upload(f, 'offline.csv') for f in offline_files]
+    report_paths = [save_upload(f, 'report.csv') for f in report_files]
+    upload_paths = online_paths + offline_paths + report_paths
+
+    # Check every upload against its schema before any heavy parsing
+    problems = preflight_uploads(
+        [(path, 'online') for path in online_paths] +
+        [(path, 'offline') for path in offline_paths] +
+        [(path, 'report') for path in report_paths],
+        view_type)
+    if problems:
+        for problem in problems:
+            flash(problem, 'error')
+        remove_uploaded_files(*upload_paths)
+        return redirect(url_for('salesovertime'))
+
+    drilldown = None
+    try:
+        # Index of rows behind each table row, only when drill-down was asked for (never for exports)
+        if request.form.get('drilldown') == 'on' and not export_format:
+            drilldown = DrillDownIndex(view_type, operating_start_hour, start_date, end_date)
 
-        # Validate that at least one file is uploaded
-        if not online_file and not offline_file:
-            flash('Please upload at least one CSV file (Online or Offline).', 'error')
-            return redirect(url_for('index'))
+        # Process CSV files (only if they were uploaded)
+        online_series = None
+        offline_series = None
 
-        # Validate file extensions for uploaded files
-        files_to_check = []
-        if online_file:
-            files_to_check.append(online_file)
-        if offline_file:
-            files_to_check.append(offline_file)
-        if report_file:
-            files_to_check.append(report_file)
+        if online_paths:
+            online_series = process_online_csv(online_paths, view_type, operating_start_hour, start_date, end_date, online_index, drilldown)
+        else:
+            # Create empty series if no online file
+            online_series = empty_sales_series(view_type)
+            print("No online CSV uploaded - using zero values")
 
-        if not all(allowed_file(f.filename) for f in files_to_check):
-            flash('Only .csv files are supported.', 'error')
-            return redirect(url_for('index'))
+        if offline_paths:
+            offline_series = process_offline_csv(offline_paths, view_type, operating_start_hour, start_date, end_date, offline_index, drilldown)
+        else:
+            # Create empty series if no offline file
+            offline_series = empty_sales_series(view_type)
+            print("No offline CSV uploaded - using zero values")
+
+        # Process report file if provided
+        report_series = None
+        if report_paths:
+            report_series = process_report_csv(report_paths, view_type, operating_start_hour, start_date, end_date)
+
+        if export_format:
+            # Stream rows as they are generated instead of building the full list first
+            remove_uploaded_files(*upload_paths)
+            rows = iter_sales_report_rows(online_series, offline_series, report_series, view_type)
+            return export_response(rows, SALES_EXPORT_COLUMNS, report_series is not None, view_type, export_format, 'sales_overtime')
+
+        rows, footer = build_sales_report(online_series, offline_series, report_series, view_type)
+        footer.update({
+            'has_online': bool(online_paths),
+            'has_offline': bool(offline_paths),
+            'start_date': start_date,
+            'end_date': end_date,
+            'dedupe': dedupe,
+            'duplicates_removed': (online_index.removed if online_index else 0) + (offline_index.removed if offline_index else 0)
+        })
+
+        # Clean up uploaded files
+        remove_uploaded_files(*upload_paths)
+
+        footer['drilldown'] = drilldown is not None
+        if drilldown:
+            drilldown.save()
+            footer['drilldown_token'] = drilldown.token
+
+        return render_template('salesovertime.html', rows=rows, footer=footer, has_result=True, view_type=view_type)
 
-        # Save uploaded files
-        online_path = None
-        offline_path = None
-
-        if online_file:
-            online_name = secure_filename(online_file.filename or 'online.csv')
-            online_path = os.path.join(app.config['UPLOAD_FOLDER'], online_name)
-            online_file.save(online_path)
-
-        if offline_file:
-            offline_name = secure_filename(offline_file.filename or 'offline.csv')
-            offline_path = os.path.join(app.config['UPLOAD_FOLDER'], offline_name)
-            offline_file.save(offline_path)
-
-        # Save report file if provided
-        report_path = None
-        if report_file:
-            report_name = secure_filename(report_file.filename or 'report.csv')
-            report_path = os.path.join(app.config['UPLOAD_FOLDER'], report_name)
-            report_file.save(report_path)
+    except Exception as e:
+        remove_uploaded_files(*upload_paths)
+        if drilldown:
+            drilldown.discard()
+        flash(f'Error processing CSV files: {str(e)}', 'error')
+        return redirect(url_for('salesovertime'))
 
-        try:
-            # Process CSV files (only if they were uploaded)
-            online_series = None
-            offline_series = None
+@app.route('/product', methods=['GET', 'POST'])
+@admission_controlled('product.html')
+def product():
+    """Product Report functionality"""
+    if request.method == 'POST':
+        return handle_product_upload()
 
-            if online_path:
-                online_series = process_online_csv(online_path, view_type, operating_start_hour)
-            else:
-                # Create empty series if no online file
-                if view_type == 'daily':
-                    online_series = pd.Series(dtype=float)
-                else:
-                    online_series = pd.Series(0.0, index=range(24))
-                print("No online CSV uploaded - using zero values")
-
-            if offline_path:
-                offline_series = process_offline_csv(offline_path, view_type, operating_start_hour)
-            else:
-                # Create empty series if no offline file
-                if view_type == 'daily':
-                    offline_series = pd.Series(dtype=float)
-                else:
-                    offline_series = pd.Series(0.0, index=range(24))
-                print("No offline CSV uploaded - using zero values")
-
-            # Process report file if provided
-            report_series = None
-            if report_path:
-                report_series = process_report_csv(report_path, view_type, operating_start_hour)
-
-            # Create combined dataframe based on view type
-            if view_type == 'daily':
-                # For daily view, we need to align dates from all series
-                all_dates = set()
-                if len(online_series) > 0:
-                    all_dates.update(online_series.index)
-                if len(offline_series) > 0:
-                    all_dates.update(offline_series.index)
-                if report_series is not None and len(report_series) > 0:
-                    all_dates.update(report_series.index)
-
-                # Convert to sorted list
-                all_dates = sorted(list(all_dates))
-
-                # Create aligned series
-                online_aligned = pd.Series(0.0, index=all_dates)
-                offline_aligned = pd.Series(0.0, index=all_dates)
-
-                if len(online_series) > 0:
-                    online_aligned.update(online_series)
-                if len(offline_series) > 0:
-                    offline_aligned.update(offline_series)
-
-                df = pd.DataFrame({
-                    'Online': online_aligned,
-                    'Offline': offline_aligned,
-                })
-                df['Total'] = df['Online'] + df['Offline']
-
-                # Add report data if available
-                if report_series is not None:
-                    report_aligned = pd.Series(0.0, index=all_dates)
-                    if len(report_series) > 0:
-                        report_aligned.update(report_series)
-                    df['Report'] = report_aligned
-            else:
-                # For hourly view (existing logic)
-                df = pd.DataFrame({
-                    'Online': online_series,
-                    'Offline': offline_series,
-                })
-                df['Total'] = df['Online'] + df['Offline']
-
-                # Add report data if available
-                if report_series is not None:
-                    df['Report'] = report_series
-
-            # Generate display data based on view type
-            rows = []
-
-            if view_type == 'daily':
-                # Daily view - iterate through dates
-                target_dates = []
-                if report_series is not None:
-                    # Find dates that have non-zero report data
-                    target_dates = [d for d in df.index if report_series is not None and d in report_series.index and report_series[d] > 0]
-                    print(f"Report dates detected: {target_dates}")
-
-                for date_idx in df.index:
-                    row_data = {
-                        'label': date_idx.strftime('%d %b %Y'),  # Format: "22 Aug 2025"
-                        'online': float(df.loc[date_idx, 'Online']),
-                        'offline': float(df.loc[date_idx, 'Offline']),
-                        'total': float(df.loc[date_idx, 'Total']),
-                        'show_in_report': date_idx in target_dates,
-                        'has_discrepancy': False,
-                        'report': 0.0,
-                        'difference': 0.0
-                    }
-
-                    # Add report data and check for discrepancies if report is available
-                    if report_series is not None and 'Report' in df.columns:
-                        row_data['report'] = float(df.loc[date_idx, 'Report'])
-
-                        # Calculate difference (Total - Report) for dates that have report data
-                        if date_idx in target_dates:
-                            total_val = row_data['total']
-                            report_val = row_data['report']
-                            row_data['difference'] = total_val - report_val
-
-                            # Consider discrepancy if difference is more than 0.01
-                            if abs(row_data['difference']) > 0.01:
-                                row_data['has_discrepancy'] = True
-
-                    rows.append(row_data)
-            else:
-                # Hourly view (existing logic)
-                target_hours = []
-                if report_series is not None:
-                    # Find hours that have non-zero report data
-                    target_hours = [h for h in range(24) if report_series[h] > 0]
-                    print(f"Report hours detected: {target_hours}")
-
-                for h in range(24):
-                    row_data = {
-                        'label': format_hour_label(h),
-                        'online': float(df.loc[h, 'Online']),
-                        'offline': float(df.loc[h, 'Offline']),
-                        'total': float(df.loc[h, 'Total']),
-                        'show_in_report': h in target_hours,
-                        'has_discrepancy': False,
-                        'report': 0.0,
-                        'difference': 0.0
-                    }
-
-                    # Add report data and check for discrepancies if report is available
-                    if report_series is not None:
-                        row_data['report'] = float(df.loc[h, 'Report'])
-
-                        # Calculate difference (Total - Report) for hours that have report data
-                        if h in target_hours:
-                            total_val = row_data['total']
-                            report_val = row_data['report']
-                            row_data['difference'] = total_val - report_val
-
-                            # Consider discrepancy if difference is more than 0.01
-                            if abs(row_data['difference']) > 0.01:
-                                row_data['has_discrepancy'] = True
-
-                    rows.append(row_data)
-
-            # Calculate totals
-            footer = {
-                'online_sum': float(df['Online'].sum()),
-                'offline_sum': float(df['Offline'].sum()),
-                'total_sum': float(df['Total'].sum()),
-                'has_report': report_series is not None,
-                'has_online': online_path is not None,
-                'has_offline': offline_path is not None,
-                'view_type': view_type
-            }
+    # GET request - show product report form
+    return render_template('product.html', rows=[], footer=None, has_result=False, view_type='daily')
 
-            if report_series is not None and 'Report' in df.columns:
-                footer['report_sum'] = float(df['Report'].sum())
-                footer['difference_sum'] = footer['total_sum'] - footer['report_sum']
+@app.route('/product/export/<export_format>', methods=['POST'])
+@admission_controlled('product.html')
+def product_export(export_format):
+    """Download the Product reconciliation as CSV or XLSX"""
+    if export_format not in EXPORT_FORMATS:
+        abort(404)
+    return handle_product_upload(export_format)
+
+@app.route('/product/ingested')
+def product_ingested():
+    """Product Report over the files precomputed by the ingest service"""
+    view_type = request.args.get('view_type', 'daily')
+    operating_start_hour = parse_operating_hours(request.args.get('operating_hours', '00:00'))
+    start_date = parse_date_input(request.args.get('start_date'))
+    end_date = parse_date_input(request.args.get('end_date'))
+
+    ingested = load_ingested_aggregates()
+    online = ingested.get(('online', 'products'))
+    offline = ingested.get(('offline', 'products'))
+    report = ingested_report(ingested, 'report_products', view_type)
+    if online is None and offline is None:
+        flash('No online or offline files have been ingested yet.', 'error')
+        return redirect(url_for('product'))
+
+    online_products = ingested_product_frame(online, view_type, operating_start_hour, start_date, end_date, hourly_requires_date=True)
+    offline_products = ingested_product_frame(offline, view_type, operating_start_hour, start_date, end_date)
+    report_products = ingested_product_frame(report, view_type, start_date=start_date, end_date=end_date, report=True)
+
+    rows, footer = build_product_report(online_products, offline_products, report_products, view_type, report is not None)
+    footer.update({
+        'has_online': online is not None,
+        'has_offline': offline is not None,
+        'start_date': start_date,
+        'end_date': end_date,
+        'ingested_files': len(ingested['files']),
+    })
+    return render_template('product.html', rows=rows, footer=footer, has_result=True, view_type=view_type)
+
+def handle_product_upload(export_format=None):
+    """Process a Product Report upload and render it, or stream it when export_format is set"""
+    # Get uploaded files
+    online_files = [f for f in request.files.getlist('online_csv') if f]
+    offline_files = [f for f in request.files.getlist('offline_csv') if f]
+    report_files = [f for f in request.files.getlist('report_csv') if f]
+
+    # Get view selection (default to daily)
+    view_type = request.form.get('view_type', 'daily')
+    print(f"Selected view type: {view_type}")
+
+    # Get operating hours (default to 00:00 if not provided)
+    operating_hours_str = request.form.get('operating_hours', '00:00')
+    operating_start_hour = parse_operating_hours(operating_hours_str)
+    print(f"Operating hours: {operating_hours_str} -> Start hour: {operating_start_hour}")
+
+    # Get optional business date range (inclusive)
+    start_date = parse_date_input(request.form.get('start_date'))
+    end_date = parse_date_input(request.form.get('end_date'))
+    print(f"Date range: {start_date} - {end_date}")
+
+    # Drop lines repeated from an earlier file of the same channel (opt-in checkbox); repeats within one file are kept
+    dedupe = request.form.get('dedupe') == 'on'
+    online_index = TransactionHashIndex('online') if dedupe else None
+    offline_index = TransactionHashIndex('offline') if dedupe else None
+
+    # Validate that at least one file is uploaded
+    if not online_files and not offline_files:
+        flash('Please upload at least one CSV file (Online or Offline).', 'error')
+        return redirect(url_for('product'))
+
+    if start_date and end_date and start_date > end_date:
+        flash('Start date must be on or before end date.', 'error')
+        return redirect(url_for('product'))
+
+    # Validate file extensions for uploaded files
+    files_to_check = online_files + offline_files + report_files
+    if not all(allowed_file(f.filename) for f in files_to_check):
+        flash('Only .csv and .xlsx files are supported.', 'error')
+        return redirect(url_for('product'))
+
+    # Save uploaded files
+    online_paths = [save_upload(f, 'online.csv') for f in online_files]
+    offline_paths = [save_upload(f, 'offline.csv') for f in offline_files]
+    report_paths = [save_upload(f, 'report.csv') for f in report_files]
+    upload_paths = online_paths + offline_paths + report_paths
+
+    # Check every upload against its schema before any heavy parsing
+    problems = preflight_uploads(
+        [(path, 'online_products') for path in online_paths] +
+        [(path, 'offline_products') for path in offline_paths] +
+        [(path, 'report_products') for path in report_paths],
+        view_type)
+    if problems:
+        for problem in problems:
+            flash(problem, 'error')
+        remove_uploaded_files(*upload_paths)
+        return redirect(url_for('product'))
+
+    drilldown = None
+    try:
+        # Index of rows behind each table row, only when drill-down was asked for (never for exports)
+        if request.form.get('drilldown') == 'on' and not export_format:
+            drilldown = DrillDownIndex(view_type, operating_start_hour, start_date, end_date)
 
-            # Clean up uploaded files
-            try:
-                if online_path:
-                    os.remove(online_path)
-                if offline_path:
-                    os.remove(offline_path)
-                if report_path:
-                    os.remove(report_path)
-            except:
-                pass
+        # Process CSV files for product analysis
+        online_products = None
+        offline_products = None
+        report_products = None
 
-            return render_template('salesovertime.html', rows=rows, footer=footer, has_result=True, view_type=view_type)
+        if online_paths:
+            online_products = process_online_csv_for_products(online_paths, view_type, operating_start_hour, start_date, end_date, online_index, drilldown)
+        else:
+            online_products = pd.DataFrame(columns=['Date', 'Item', 'Quantity'])
+            print("No online CSV uploaded - using empty product data")
 
-        except Exception as e:
-            flash(f'Error processing CSV files: {str(e)}', 'error')
-            return redirect(url_for('salesovertime'))
+        if offline_paths:
+            offline_products = process_offline_csv_for_products(offline_paths, view_type, operating_start_hour, start_date, end_date, offline_index, drilldown)
+        else:
+            offline_products = pd.DataFrame(columns=['Date', 'Item', 'Quantity'])
+            print("No offline CSV uploaded - using empty product data")
 
-    # GET request
-    return render_template('salesovertime.html', rows=[], footer=None, has_result=False, view_type='daily')
+        if report_paths:
+            report_products = process_report_csv_for_products(report_paths, view_type, start_date, end_date)
+        else:
+            report_products = pd.DataFrame(columns=['Date', 'Item', 'Quantity'])
+
+        if export_format:
+            # Stream rows as they are generated instead of building the full list first
+            remove_uploaded_files(*upload_paths)
+            rows = iter_product_rows(online_products, offline_products, report_products, view_type)
+            return export_response(rows, PRODUCT_EXPORT_COLUMNS, bool(report_paths), view_type, export_format, 'product_report')
+
+        rows, footer = build_product_report(online_products, offline_products, report_products, view_type, bool(report_paths))
+        footer.update({
+            'has_online': bool(online_paths),
+            'has_offline': bool(offline_paths),
+            'start_date': start_date,
+            'end_date': end_date,
+            'dedupe': dedupe,
+            'duplicates_removed': (online_index.removed if online_index else 0) + (offline_index.removed if offline_index else 0)
+        })
+
+        # Clean up uploaded files
+        remove_uploaded_files(*upload_paths)
+
+        footer['drilldown'] = drilldown is not None
+        if drilldown:
+            drilldown.save()
+            footer['drilldown_token'] = drilldown.token
+
+        return render_template('product.html', rows=rows, footer=footer, has_result=True, view_type=view_type)
 
-@app.route('/product', methods=['GET', 'POST'])
-def product():
-    """Product Report functionality"""
+    except Exception as e:
+        remove_uploaded_files(*upload_paths)
+        if drilldown:
+            drilldown.discard()
+        flash(f'Error processing CSV files: {str(e)}', 'error')
+        return redirect(url_for('product'))
+
+@app.route('/drilldown/<token>/<report>')
+def drilldown(token, report):
+    """Show the transactions behind one row of a sales or product report, including excluded ones"""
+    if report not in DRILLDOWN_REPORTS or len(token) != 32 or not all(c in '0123456789abcdef' for c in token):
+        abort(404)
+    bucket = request.args.get('bucket', '')
+    item = request.args.get('item') if report == 'products' else None
+
+    result = lookup_drilldown(token, report, bucket, item)
+    if result is None:
+        abort(404)
+
+    exclusion_column = DRILLDOWN_REPORTS[report]
+    channels = []
+    for channel, rows in result.items():
+        columns = []
+        for row in rows:
+            columns.extend(col for col in row if col not in columns and col not in ('Sales Exclusion', 'Product Exclusion'))
+        channels.append({
+            'name': channel.capitalize(),
+            'columns': columns,
+            'included': [row for row in rows if not row.get(exclusion_column)],
+            'excluded': [row for row in rows if row.get(exclusion_column)],
+            'exclusion_column': exclusion_column,
+        })
+    print(f"🔎 Drill-down {report} {bucket} {item or ''}: " + ', '.join(f"{c['name']} {len(c['included'])}+{len(c['excluded'])}" for c in channels))
+
+    return render_template('drilldown.html', channels=channels, report=report,
+                           label=request.args.get('label', bucket), item=item)
+
+@app.route('/reconcile', methods=['GET', 'POST'])
+@admission_controlled('reconcile.html')
+def reconcile():
+    """Sales overtime and product reports computed from a single ingest of each upload"""
     if request.method == 'POST':
         # Get uploaded files
-        online_file = request.files.get('online_csv')
-        offline_file = request.files.get('offline_csv')
-        report_file = request.files.get('report_csv')
+        online_files = [f for f in request.files.getlist('online_csv') if f]
+        offline_files = [f for f in request.files.getlist('offline_csv') if f]
+        report_files = [f for f in request.files.getlist('report_csv') if f]
+        product_report_files = [f for f in request.files.getlist('product_report_csv') if f]
 
         # Get view selection (default to daily)
         view_type = request.form.get('view_type', 'daily')
@@ -822,164 +2986,123 @@ def product():
         operating_start_hour = parse_operating_hours(operating_hours_str)
         print(f"Operating hours: {operating_hours_str} -> Start hour: {operating_start_hour}")
 
+        # Get optional business date range (inclusive)
+        start_date = parse_date_input(request.form.get('start_date'))
+        end_date = parse_date_input(request.form.get('end_date'))
+        print(f"Date range: {start_date} - {end_date}")
+
+        # Drop lines repeated from an earlier file of the same channel (opt-in checkbox); repeats within one file are kept
+        dedupe = request.form.get('dedupe') == 'on'
+        online_index = TransactionHashIndex('online') if dedupe else None
+        offline_index = TransactionHashIndex('offline') if dedupe else None
+
         # Validate that at least one file is uploaded
-        if not online_file and not offline_file:
+        if not online_files and not offline_files:
             flash('Please upload at least one CSV file (Online or Offline).', 'error')
-            return redirect(url_for('product'))
+            return redirect(url_for('reconcile'))
 
-        # Validate file extensions for uploaded files
-        files_to_check = []
-        if online_file:
-            files_to_check.append(online_file)
-        if offline_file:
-            files_to_check.append(offline_file)
-        if report_file:
-            files_to_check.append(report_file)
+        # The reconcile page has no date x hour layout
+        if view_type not in ('daily', 'hourly'):
+            flash('Reconcile supports the daily and hourly views only.', 'error')
+            return redirect(url_for('reconcile'))
+
+        if start_date and end_date and start_date > end_date:
+            flash('Start date must be on or before end date.', 'error')
+            return redirect(url_for('reconcile'))
 
+        # Validate file extensions for uploaded files
+        files_to_check = online_files + offline_files + report_files + product_report_files
         if not all(allowed_file(f.filename) for f in files_to_check):
-            flash('Only .csv files are supported.', 'error')
-            return redirect(url_for('product'))
+            flash('Only .csv and .xlsx files are supported.', 'error')
+            return redirect(url_for('reconcile'))
 
         # Save uploaded files
-        online_path = None
-        offline_path = None
-        report_path = None
-
-        if online_file:
-            online_name = secure_filename(online_file.filename or 'online.csv')
-            online_path = os.path.join(app.config['UPLOAD_FOLDER'], online_name)
-            online_file.save(online_path)
-
-        if offline_file:
-            offline_name = secure_filename(offline_file.filename or 'offline.csv')
-            offline_path = os.path.join(app.config['UPLOAD_FOLDER'], offline_name)
-            offline_file.save(offline_path)
-
-        if report_file:
-            report_name = secure_filename(report_file.filename or 'report.csv')
-            report_path = os.path.join(app.config['UPLOAD_FOLDER'], report_name)
-            report_file.save(report_path)
-
+        online_paths = [save_upload(f, 'online.csv') for f in online_files]
+        offline_paths = [save_upload(f, 'offline.csv') for f in offline_files]
+        report_paths = [save_upload(f, 'report.csv') for f in report_files]
+        product_report_paths = [save_upload(f, 'product_report.csv') for f in product_report_files]
+        upload_paths = online_paths + offline_paths + report_paths + product_report_paths
+
+        # Check every upload against its schema before any heavy parsing
+        problems = preflight_uploads(
+            [(path, 'online_all') for path in online_paths] +
+            [(path, 'offline_all') for path in offline_paths] +
+            [(path, 'report') for path in report_paths] +
+            [(path, 'report_products') for path in product_report_paths],
+            view_type)
+        if problems:
+            for problem in problems:
+                flash(problem, 'error')
+            remove_uploaded_files(*upload_paths)
+            return redirect(url_for('reconcile'))
+
+        drilldown = None
         try:
-            # Process CSV files for product analysis
-            online_products = None
-            offline_products = None
-            report_products = None
-
-            if online_path:
-                online_products = process_online_csv_for_products(online_path, view_type, operating_start_hour)
-            else:
-                online_products = pd.DataFrame(columns=['Date', 'Item', 'Quantity'])
-                print("No online CSV uploaded - using empty product data")
-
-            if offline_path:
-                offline_products = process_offline_csv_for_products(offline_path, view_type, operating_start_hour)
-            else:
-                offline_products = pd.DataFrame(columns=['Date', 'Item', 'Quantity'])
-                print("No offline CSV uploaded - using empty product data")
-
-            if report_path:
-                report_products = process_report_csv_for_products(report_path, view_type)
-            else:
-                report_products = pd.DataFrame(columns=['Date', 'Item', 'Quantity'])
-
-            # Combine all data to get unique date-product combinations
-            all_combinations = set()
-
-            for df in [online_products, offline_products, report_products]:
-                if len(df) > 0:
-                    for _, row in df.iterrows():
-                        # Ensure both date and item are valid
-                        if pd.notna(row['Date']) and pd.notna(row['Item']) and str(row['Item']).strip():
-                            all_combinations.add((row['Date'], str(row['Item']).strip()))
-
-            # Create rows for the table
-            rows = []
-
-            # Sort combinations by date first, then by item name
-            sorted_combinations = sorted(all_combinations, key=lambda x: (x[0], x[1].lower()))
-
-            for date, item in sorted_combinations:
-                # Get quantities for this date-item combination
-                online_qty = 0
-                offline_qty = 0
-                report_qty = 0
-
-                if len(online_products) > 0:
-                    online_match = online_products[(online_products['Date'] == date) & (online_products['Item'] == item)]
-                    if len(online_match) > 0:
-                        online_qty = round(online_match['Quantity'].sum(), 2)
-
-                if len(offline_products) > 0:
-                    offline_match = offline_products[(offline_products['Date'] == date) & (offline_products['Item'] == item)]
-                    if len(offline_match) > 0:
-                        offline_qty = round(offline_match['Quantity'].sum(), 2)
-
-                if len(report_products) > 0:
-                    report_match = report_products[(report_products['Date'] == date) & (report_products['Item'] == item)]
-                    if len(report_match) > 0:
-                        report_qty = round(report_match['Quantity'].sum(), 2)
-
-                total_qty = online_qty + offline_qty
-                difference = total_qty - report_qty
-
-                # Format date/time based on view type
-                if view_type == 'hourly':
-                    # For hourly view, date is actually an hour (0-23)
-                    if isinstance(date, int):
-                        date_label = format_hour_label(date)
-                    else:
-                        date_label = str(date)
-                else:
-                    # For daily view, format as date
-                    date_label = date.strftime('%d %b %Y')
-
-                row_data = {
-                    'date': date_label,
-                    'product_name': item,
-                    'online': online_qty,
-                    'offline': offline_qty,
-                    'total': total_qty,
-                    'report': report_qty,
-                    'difference': difference,
-                    'show_in_report': report_qty > 0,
-                    'has_discrepancy': abs(difference) > 0 and report_qty > 0
-                }
-
-                rows.append(row_data)
-
-            # Calculate totals
-            footer = {
-                'online_sum': sum(row['online'] for row in rows),
-                'offline_sum': sum(row['offline'] for row in rows),
-                'total_sum': sum(row['total'] for row in rows),
-                'report_sum': sum(row['report'] for row in rows),
-                'difference_sum': sum(row['total'] for row in rows) - sum(row['report'] for row in rows),
-                'has_report': report_path is not None,
-                'has_online': online_path is not None,
-                'has_offline': offline_path is not None,
-                'view_type': view_type
-            }
+            # Index of rows behind each table row, only when drill-down was asked for
+            if request.form.get('drilldown') == 'on':
+                drilldown = DrillDownIndex(view_type, operating_start_hour, start_date, end_date)
+
+            # Read each transaction file once into the canonical table and aggregate it both ways
+            def sales_and_products(hourly_requires_date):
+                return lambda txns: (aggregate_sales(txns, view_type, operating_start_hour),
+                                     aggregate_products(txns, view_type, operating_start_hour, start_date, end_date, hourly_requires_date))
+
+            online_partials = ingest_channel_files(online_paths, 'online', sales_and_products(True), operating_start_hour,
+                                                   start_date, end_date, hash_index=online_index, drilldown=drilldown)
+            offline_partials = ingest_channel_files(offline_paths, 'offline', sales_and_products(False), operating_start_hour,
+                                                    start_date, end_date, hash_index=offline_index, drilldown=drilldown)
+
+            # Sales overtime from the shared tables
+            empty_series = empty_sales_series(view_type)
+            online_series = merge_sales_series([p[0] for p in online_partials], view_type) if online_partials else empty_series
+            offline_series = merge_sales_series([p[0] for p in offline_partials], view_type) if offline_partials else empty_series
+            report_series = None
+            if report_paths:
+                report_series = process_report_csv(report_paths, view_type, operating_start_hour, start_date, end_date)
+
+            sales_rows, sales_footer = build_sales_report(online_series, offline_series, report_series, view_type)
+
+            # Products from the same tables
+            online_products = merge_product_frames([p[1] for p in online_partials])
+            offline_products = merge_product_frames([p[1] for p in offline_partials])
+            report_products = pd.DataFrame(columns=['Date', 'Item', 'Quantity'])
+            if product_report_paths:
+                report_products = process_report_csv_for_products(product_report_paths, view_type, start_date, end_date)
+
+            product_rows, product_footer = build_product_report(online_products, offline_products, report_products, view_type, bool(product_report_paths))
+
+            for footer in [sales_footer, product_footer]:
+                footer.update({
+                    'has_online': bool(online_paths),
+                    'has_offline': bool(offline_paths),
+                    'start_date': start_date,
+                    'end_date': end_date,
+                    'dedupe': dedupe,
+                    'duplicates_removed': (online_index.removed if online_index else 0) + (offline_index.removed if offline_index else 0),
+                    'drilldown': drilldown is not None
+                })
+                if drilldown:
+                    footer['drilldown_token'] = drilldown.token
+            if drilldown:
+                drilldown.save()
 
             # Clean up uploaded files
-            try:
-                if online_path:
-                    os.remove(online_path)
-                if offline_path:
-                    os.remove(offline_path)
-                if report_path:
-                    os.remove(report_path)
-            except:
-                pass
+            remove_uploaded_files(*upload_paths)
 
-            return render_template('product.html', rows=rows, footer=footer, has_result=True, view_type=view_type)
+            return render_template('reconcile.html', sales_rows=sales_rows, sales_footer=sales_footer,
+                                   product_rows=product_rows, product_footer=product_footer,
+                                   has_result=True, view_type=view_type)
 
         except Exception as e:
+            remove_uploaded_files(*upload_paths)
+            if drilldown:
+                drilldown.discard()
             flash(f'Error processing CSV files: {str(e)}', 'error')
-            return redirect(url_for('product'))
+            return redirect(url_for('reconcile'))
 
-    # GET request - show product report form
-    return render_template('product.html', rows=[], footer=None, has_result=False, view_type='daily')
+    # GET request
+    return render_template('reconcile.html', sales_rows=[], sales_footer=None, product_rows=[], product_footer=None,
+                           has_result=False, view_type='daily')
 
 if __name__ == '__main__':
     # For production deployment, use gunicorn; for local debugging use the line below
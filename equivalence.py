@@ -0,0 +1,718 @@
+"""
+Differential equivalence harness for the processing paths in app.py.
+
+The oracle is a frozen copy of the original per-row implementation:
+parse_time_to_hour, get_business_date, parse_time_to_date, parse_report_date,
+the report column detection and the six process_* functions as they were
+before any optimisation (debug prints removed, logic untouched). The date x
+hour matrix came later; its oracle applies the frozen daily and hourly rules to
+the same rows and keeps those with both a date and an hour. Every candidate
+engine is run on randomized and adversarial CSVs, and its hourly series, daily
+series, matrices and product frames must match the oracle exactly:
+
+    mixed timestamp formats, blank/NaN/garbage times, times either side of
+    the operating start hour and of midnight, Returns and Refunds, odd
+    Is_Cancelled spellings, statuses in any case, blank and service items,
+    zero/negative/missing quantities, orders with back-filled Created Time
+
+Candidates:
+    current     app.py as configured (C engine, whole-file reads)
+    pyarrow     app.py with CSV_ENGINE=pyarrow (skipped if pyarrow is missing)
+    chunked     app.py with a date range pushed into ingestion and tiny chunks
+    multi-file  every input split into three uploads of one field; summed in a
+                different order, so compared to 1e-9 rather than bit for bit
+    split-orders  the online input split inside orders, so the Created Time
+                back-fill has to look across files (compared to 1e-9)
+    dedupe      every online/offline file uploaded twice with duplicate removal
+                on, the second time with some lines repeated; only the repeats
+                may survive from the second copy (compared to 1e-9)
+    xlsx        every input converted to an .xlsx workbook
+    timestamps  app.py's row parsers, business_dates_vectorized and timestamp_values,
+                value by value
+
+A new engine is added by registering a function in CANDIDATES that returns
+the same keys as run_oracle for a generated case.
+
+Example:
+    python equivalence.py --seeds 25 --rows 400
+    python equivalence.py --candidates pyarrow,chunked --keep
+"""
+import argparse
+import contextlib
+import io
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import warnings
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import app as app_module
+
+VIEW_TYPES = ['daily', 'hourly', 'matrix']
+OPERATING_HOURS = [0, 5, 23]
+
+ITEMS = ['Latte', ' Latte ', 'latte', 'Mocha', 'Bagel', 'Croissant', 'Tea', '', None,
+         'Service Charge', 'Discount', 'Tax']
+ONLINE_STATUSES = ['Completed', 'Completed', 'Pending Store Acceptance', 'Cancelled', 'cancelled ', 'CANCELLED',
+                   'Pending Payment', 'pending payment', 'Refunded', None]
+TRANSACTION_TYPES = ['Sale', 'Sale', 'Sale', 'sale', ' Sale', 'SALE', 'Return', 'Refund', 'Void', None]
+IS_CANCELLED_MIXED = ['False', 'False', 'True', 'TRUE', 'true', 'T', 't', '1', '0', 'YES', 'yes', 'No', 'N', None]
+QUANTITIES = [1, 1, 2, 3, 5, 0, -1, 1.5, None]
+TIMESTAMP_FORMATS = ['%m/%d/%Y %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%m/%d/%Y %H:%M:%S',
+                     '%m/%d/%Y', '%Y-%m-%d', '%d %b %Y', '%d %b %Y (%a)', '%Y-%m-%dT%H:%M:%S']
+ODD_TIMESTAMPS = ['', ' ', 'nan', 'NaN', 'None', 'null', 'not a time', '25/13/2025 10:00', '11 AM', None]
+
+
+# ---------------------------------------------------------------------------
+# Oracle: frozen copies of the original per-row implementation
+# ---------------------------------------------------------------------------
+
+def reference_parse_time_to_hour(time_str):
+    try:
+        time_str = str(time_str).strip()
+        if 'AM' in time_str.upper() or 'PM' in time_str.upper():
+            parts = time_str.upper().replace('AM', '').replace('PM', '').strip()
+            hour = int(parts)
+            if 'PM' in time_str.upper() and hour != 12:
+                hour += 12
+            elif 'AM' in time_str.upper() and hour == 12:
+                hour = 0
+            return hour
+        formats = ['%m/%d/%Y %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%m/%d/%Y %H:%M:%S']
+        for fmt in formats:
+            try:
+                return datetime.strptime(time_str, fmt).hour
+            except ValueError:
+                continue
+        return pd.to_datetime(time_str).hour
+    except:
+        return None
+
+
+def reference_get_business_date(dt, operating_start_hour=0):
+    if dt.hour < operating_start_hour:
+        return (dt.date() - timedelta(days=1))
+    return dt.date()
+
+
+def reference_parse_time_to_date(time_str, operating_start_hour=0):
+    try:
+        time_str = str(time_str).strip()
+        if time_str in ['nan', 'NaN', 'None', '', 'null']:
+            return None
+        formats = ['%m/%d/%Y %H:%M', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%m/%d/%Y %H:%M:%S',
+                   '%m/%d/%Y', '%Y-%m-%d', '%d %b %Y (%a)', '%d %b %Y']
+        for fmt in formats:
+            try:
+                return reference_get_business_date(datetime.strptime(time_str, fmt), operating_start_hour)
+            except ValueError:
+                continue
+        try:
+            dt = pd.to_datetime(time_str)
+            if pd.isna(dt):
+                return None
+            return reference_get_business_date(dt, operating_start_hour)
+        except Exception:
+            pass
+    except Exception:
+        return None
+
+
+def reference_parse_report_date(time_str):
+    try:
+        time_str = str(time_str).strip()
+        for fmt in ['%d %b %Y (%a)', '%d %b %Y', '%m/%d/%Y', '%Y-%m-%d']:
+            try:
+                return datetime.strptime(time_str, fmt).date()
+            except ValueError:
+                continue
+        return pd.to_datetime(time_str).date()
+    except:
+        return None
+
+
+def reference_detect_report_columns(columns):
+    datetime_col = None
+    value_col = None
+    datetime_candidates = ['datetime', 'date_time', 'time', 'timestamp', 'created_time', 'date', 'date / time']
+    for col in columns:
+        if col.lower().strip() in datetime_candidates or 'time' in col.lower() or 'date' in col.lower():
+            datetime_col = col
+            break
+    value_candidates = ['total', 'amount', 'value', 'sum', 'revenue', 'total sales', 'sales']
+    for col in columns:
+        col_lower = col.lower().strip()
+        if col_lower in value_candidates or 'total' in col_lower or 'sales' in col_lower:
+            value_col = col
+            break
+    if datetime_col is None:
+        datetime_col = columns[0]
+    if value_col is None:
+        value_col = columns[1] if len(columns) > 1 else columns[0]
+    return datetime_col, value_col
+
+
+def reference_matrix(df, time_col, value_col, parse_date, keys=()):
+    """Matrix oracle: rows with both a date (parse_date) and an hour, summed per (date, hour, *keys)"""
+    df = df.copy()
+    df['Date'] = df[time_col].apply(parse_date)
+    df['Hour'] = df[time_col].apply(reference_parse_time_to_hour)
+    df = df.dropna(subset=['Date', 'Hour'])
+    df['Hour'] = df['Hour'].astype(int)
+    return df.groupby(['Date', 'Hour', *keys])[value_col].sum()
+
+
+def reference_hourly(df, time_col, value_col):
+    df = df.copy()
+    df['Hour'] = df[time_col].apply(reference_parse_time_to_hour)
+    df = df.dropna(subset=['Hour'])
+    result = pd.Series(0.0, index=range(24))
+    result.update(df.groupby('Hour')[value_col].sum())
+    return result
+
+
+def reference_offline_csv(file_path, view_type, operating_start_hour):
+    df = pd.read_csv(file_path)
+    df['Is_Cancelled_Bool'] = df['Is_Cancelled'].astype(str).str.upper().isin(['TRUE', 'T', '1', 'YES'])
+    filtered_df = df[(df['Transaction Type'].str.strip().str.lower() == 'sale') & (df['Is_Cancelled_Bool'] == False)].copy()
+    if len(filtered_df) == 0:
+        return pd.Series(dtype=float) if view_type == 'daily' else pd.Series(0.0, index=range(24))
+    if view_type == 'daily':
+        filtered_df['Date'] = filtered_df['Time'].apply(lambda x: reference_parse_time_to_date(x, operating_start_hour))
+        return filtered_df.dropna(subset=['Date']).groupby('Date')['Total'].sum()
+    if view_type == 'matrix':
+        return reference_matrix(filtered_df, 'Time', 'Total', lambda x: reference_parse_time_to_date(x, operating_start_hour))
+    return reference_hourly(filtered_df, 'Time', 'Total')
+
+
+def reference_online_csv(file_path, view_type, operating_start_hour):
+    df = pd.read_csv(file_path)
+    filtered_df = df[~df['Status'].str.strip().str.lower().isin(['cancelled', 'pending payment'])].copy()
+    if len(filtered_df) == 0:
+        return pd.Series(dtype=float) if view_type == 'daily' else pd.Series(0.0, index=range(24))
+    if view_type == 'daily':
+        filtered_df['Date'] = filtered_df['Created Time'].apply(lambda x: reference_parse_time_to_date(x, operating_start_hour))
+        return filtered_df.dropna(subset=['Date']).groupby('Date')['Total'].sum()
+    if view_type == 'matrix':
+        return reference_matrix(filtered_df, 'Created Time', 'Total', lambda x: reference_parse_time_to_date(x, operating_start_hour))
+    return reference_hourly(filtered_df, 'Created Time', 'Total')
+
+
+def reference_report_csv(file_path, view_type, operating_start_hour):
+    df = pd.read_csv(file_path)
+    datetime_col, value_col = reference_detect_report_columns(df.columns)
+    if view_type == 'daily':
+        df['Date'] = df[datetime_col].apply(reference_parse_report_date)
+        return df.dropna(subset=['Date']).groupby('Date')[value_col].sum()
+    if view_type == 'matrix':
+        return reference_matrix(df, datetime_col, value_col, reference_parse_report_date)
+    return reference_hourly(df, datetime_col, value_col)
+
+
+def reference_online_csv_for_products(file_path, view_type, operating_start_hour):
+    df = pd.read_csv(file_path)
+    if 'OrderId' in df.columns:
+        def fill_created_time(group):
+            valid_times = group['Created Time'].dropna()
+            if len(valid_times) > 0:
+                group['Created Time'] = group['Created Time'].fillna(valid_times.iloc[0])
+            return group
+        df = df.groupby('OrderId', group_keys=False).apply(fill_created_time)
+    df = df[~df['Status'].isin(['Cancelled', 'Pending Payment'])]
+    df = df[df['Quantity'].notna() & (df['Quantity'] > 0)]
+    df = df[df['Item'].notna() & (df['Item'].astype(str).str.strip() != '')]
+    df['Item'] = df['Item'].astype(str).str.strip()
+    if view_type == 'matrix':
+        return reference_matrix(df, 'Created Time', 'Quantity', lambda x: reference_parse_time_to_date(x, operating_start_hour),
+                                ['Item']).reset_index()
+    df['Date'] = df['Created Time'].apply(lambda x: reference_parse_time_to_date(x, operating_start_hour))
+    df = df.dropna(subset=['Date'])
+    if view_type == 'hourly':
+        df['Hour'] = df['Created Time'].apply(reference_parse_time_to_hour)
+        df = df.dropna(subset=['Hour'])
+        return df.groupby(['Hour', 'Item'])['Quantity'].sum().reset_index().rename(columns={'Hour': 'Date'})
+    return df.groupby(['Date', 'Item'])['Quantity'].sum().reset_index()
+
+
+def reference_offline_csv_for_products(file_path, view_type, operating_start_hour):
+    df = pd.read_csv(file_path)
+    df = df[(df['Transaction Type'].isin(['Sale', 'Return'])) & (df['Is_Cancelled'] == False)]
+    df = df[df['Quantity'].notna() & (df['Quantity'] > 0)]
+    df = df[df['Item'].notna() & (df['Item'].astype(str).str.strip() != '')]
+    df['Item'] = df['Item'].astype(str).str.strip()
+    df = df[~df['Item'].isin(['Service Charge', 'Discount', 'Tax'])]
+    df['Signed_Quantity'] = df.apply(lambda row: row['Quantity'] if row['Transaction Type'] == 'Sale' else -row['Quantity'], axis=1)
+    if view_type == 'matrix':
+        return reference_matrix(df, 'Time', 'Signed_Quantity', lambda x: reference_parse_time_to_date(x, operating_start_hour),
+                                ['Item']).rename('Quantity').reset_index()
+    if view_type == 'hourly':
+        df['Hour'] = df['Time'].apply(reference_parse_time_to_hour)
+        df = df.dropna(subset=['Hour'])
+        product_data = df.groupby(['Hour', 'Item'])['Signed_Quantity'].sum().reset_index()
+        return product_data.rename(columns={'Hour': 'Date', 'Signed_Quantity': 'Quantity'})
+    df['Date'] = df['Time'].apply(lambda x: reference_parse_time_to_date(x, operating_start_hour))
+    df = df.dropna(subset=['Date'])
+    product_data = df.groupby(['Date', 'Item'])['Signed_Quantity'].sum().reset_index()
+    return product_data.rename(columns={'Signed_Quantity': 'Quantity'})
+
+
+def reference_report_csv_for_products(file_path, view_type):
+    df = pd.read_csv(file_path)
+    if view_type == 'hourly':
+        df['Hour'] = df['Date / Time'].apply(reference_parse_time_to_hour)
+        df = df.dropna(subset=['Hour'])
+        product_data = df[['Hour', 'Product Name', 'Total Items Sold']].copy()
+    elif view_type == 'matrix':
+        df['Date'] = df['Date / Time'].apply(reference_parse_report_date)
+        df['Hour'] = df['Date / Time'].apply(reference_parse_time_to_hour)
+        df = df.dropna(subset=['Date', 'Hour'])
+        product_data = df[['Date', 'Hour', 'Product Name', 'Total Items Sold']].copy()
+        product_data.columns = ['Date', 'Hour', 'Item', 'Quantity']
+        product_data['Item'] = product_data['Item'].astype(str).str.strip()
+        return product_data
+    else:
+        df['Date'] = df['Date / Time'].apply(reference_parse_report_date)
+        df = df.dropna(subset=['Date'])
+        product_data = df[['Date', 'Product Name', 'Total Items Sold']].copy()
+    product_data.columns = ['Date', 'Item', 'Quantity']
+    product_data['Item'] = product_data['Item'].astype(str).str.strip()
+    return product_data
+
+
+# ---------------------------------------------------------------------------
+# Input generation
+# ---------------------------------------------------------------------------
+
+def random_timestamp(rng, base, operating_start_hour):
+    """A timestamp near base, biased towards the operating start hour and midnight, in a random format"""
+    if rng.random() < 0.08:
+        return rng.choice(ODD_TIMESTAMPS)
+    day = base + timedelta(days=rng.randrange(5))
+    boundary = rng.random()
+    if boundary < 0.25:
+        moment = day.replace(hour=operating_start_hour) + timedelta(minutes=rng.choice([-61, -1, 0, 1, 59]))
+    elif boundary < 0.4:
+        moment = day.replace(hour=0) + timedelta(minutes=rng.choice([-1, 0, 1]), seconds=rng.choice([0, 59]))
+    else:
+        moment = day + timedelta(minutes=rng.randrange(24 * 60), seconds=rng.randrange(60))
+    text = moment.strftime(rng.choice(TIMESTAMP_FORMATS))
+    return f' {text} ' if rng.random() < 0.05 else text
+
+
+def random_total(rng):
+    if rng.random() < 0.03:
+        return None
+    return round(rng.uniform(-20, 120), 2)
+
+
+def generate_case(directory, seed, rows, operating_start_hour):
+    """Write one randomized set of input files and return their paths"""
+    rng = random.Random(seed)
+    base = datetime(2025, 7, 28)
+    paths = {name: os.path.join(directory, f'{name}.csv') for name in
+             ['online', 'offline', 'report', 'report_hourly', 'report_matrix',
+              'report_products', 'report_products_hourly', 'report_products_matrix']}
+
+    # Online: orders of several lines, some lines with a blank Created Time to be back-filled
+    online = []
+    order_id = 1000
+    while len(online) < rows:
+        order_id += 1
+        created = random_timestamp(rng, base, operating_start_hour)
+        status = rng.choice(ONLINE_STATUSES)
+        for line in range(rng.randint(1, 4)):
+            online.append({
+                'OrderId': None if rng.random() < 0.03 else order_id,
+                'Created Time': created if line == 0 or rng.random() < 0.5 else None,
+                'Status': status,
+                'Item': rng.choice(ITEMS),
+                'Quantity': rng.choice(QUANTITIES),
+                'Total': random_total(rng),
+            })
+    online = pd.DataFrame(online[:rows])
+    if rng.random() < 0.15:
+        online = online.drop(columns=['OrderId'])
+    online.to_csv(paths['online'], index=False)
+
+    # Offline: Is_Cancelled is either a clean boolean column or a mix of spellings
+    mixed_cancelled = rng.random() < 0.5
+    offline = pd.DataFrame([{
+        'Time': random_timestamp(rng, base, operating_start_hour),
+        'Transaction Type': rng.choice(TRANSACTION_TYPES),
+        'Is_Cancelled': rng.choice(IS_CANCELLED_MIXED) if mixed_cancelled else rng.random() < 0.1,
+        'Item': rng.choice(ITEMS),
+        'Quantity': rng.choice(QUANTITIES),
+        'Total': random_total(rng),
+    } for _ in range(rows)])
+    offline.to_csv(paths['offline'], index=False)
+
+    days = [base + timedelta(days=d) for d in range(-1, 6)]
+    report_rows = [{'Date': d.strftime(rng.choice(['%d %b %Y (%a)', '%d %b %Y', '%m/%d/%Y', '%Y-%m-%d'])),
+                    'Total Sales': round(rng.uniform(0, 900), 2)} for d in days]
+    report_rows.append({'Date': 'Grand Total', 'Total Sales': 1.0})
+    pd.DataFrame(report_rows).to_csv(paths['report'], index=False)
+    # Hour labels as exported ("9 AM") or zero padded ("09 AM")
+    pd.DataFrame([{'Time': app_module.format_hour_label(h) if rng.random() < 0.3 else f"{h % 12 or 12} {'AM' if h < 12 else 'PM'}",
+                   'Total Sales': round(rng.uniform(0, 90), 2)} for h in range(24)] +
+                 [{'Time': 'Total', 'Total Sales': 5.0}]).to_csv(paths['report_hourly'], index=False)
+
+    items = [item for item in ITEMS if item]
+    pd.DataFrame([{'Date / Time': d.strftime('%d %b %Y (%a)'), 'Product Name': rng.choice(items),
+                   'Total Items Sold': rng.randint(0, 20)} for d in days for _ in range(4)]).to_csv(paths['report_products'], index=False)
+    pd.DataFrame([{'Date / Time': rng.choice(['9 AM', '12 PM', '12 AM', '3 PM', '11 PM', 'n/a']), 'Product Name': rng.choice(items),
+                   'Total Items Sold': rng.randint(0, 20)} for _ in range(30)]).to_csv(paths['report_products_hourly'], index=False)
+    # Matrix view: full timestamps, so each report row has a date and an hour
+    pd.DataFrame([{'Date / Time': random_timestamp(rng, base, operating_start_hour), 'Total Sales': round(rng.uniform(0, 90), 2)}
+                  for _ in range(40)]).to_csv(paths['report_matrix'], index=False)
+    pd.DataFrame([{'Date / Time': random_timestamp(rng, base, operating_start_hour), 'Product Name': rng.choice(items),
+                   'Total Items Sold': rng.randint(0, 20)} for _ in range(40)]).to_csv(paths['report_products_matrix'], index=False)
+    return paths
+
+
+# ---------------------------------------------------------------------------
+# Running and comparing
+# ---------------------------------------------------------------------------
+
+def report_path(paths, view_type, products=False):
+    name = 'report_products' if products else 'report'
+    return paths[name if view_type == 'daily' else f'{name}_{view_type}']
+
+
+def run_oracle(paths, view_type, operating_start_hour):
+    return {
+        'online': reference_online_csv(paths['online'], view_type, operating_start_hour),
+        'offline': reference_offline_csv(paths['offline'], view_type, operating_start_hour),
+        'report': reference_report_csv(report_path(paths, view_type), view_type, operating_start_hour),
+        'online_products': reference_online_csv_for_products(paths['online'], view_type, operating_start_hour),
+        'offline_products': reference_offline_csv_for_products(paths['offline'], view_type, operating_start_hour),
+        'report_products': reference_report_csv_for_products(report_path(paths, view_type, True), view_type),
+    }
+
+
+def run_app(paths, view_type, operating_start_hour, start_date=None, end_date=None):
+    """The six process_* functions of app.py; any entry of paths may be a list of files"""
+    reports = {'report': report_path(paths, view_type), 'report_products': report_path(paths, view_type, True)}
+    return {
+        'online': app_module.process_online_csv(paths['online'], view_type, operating_start_hour, start_date, end_date),
+        'offline': app_module.process_offline_csv(paths['offline'], view_type, operating_start_hour, start_date, end_date),
+        'report': app_module.process_report_csv(reports['report'], view_type, operating_start_hour, start_date, end_date),
+        'online_products': app_module.process_online_csv_for_products(paths['online'], view_type, operating_start_hour, start_date, end_date),
+        'offline_products': app_module.process_offline_csv_for_products(paths['offline'], view_type, operating_start_hour, start_date, end_date),
+        'report_products': app_module.process_report_csv_for_products(reports['report_products'], view_type, start_date, end_date),
+    }
+
+
+def run_current(paths, view_type, operating_start_hour, workdir):
+    return run_app(paths, view_type, operating_start_hour)
+
+
+def run_pyarrow(paths, view_type, operating_start_hour, workdir):
+    previous = app_module.app.config['CSV_ENGINE']
+    app_module.app.config['CSV_ENGINE'] = 'pyarrow'
+    try:
+        return run_app(paths, view_type, operating_start_hour)
+    finally:
+        app_module.app.config['CSV_ENGINE'] = previous
+
+
+def dated_rows_only(paths, operating_start_hour, workdir):
+    """
+    Oracle input for the chunked candidate.
+
+    With a date range set, a row whose timestamp has no business date ("11 AM",
+    garbage) cannot be in range, even in the hourly view. Blank times stay for
+    the online Created Time back-fill.
+    """
+    prepared = dict(paths)
+    for name, time_col in [('online', 'Created Time'), ('offline', 'Time')]:
+        df = pd.read_csv(paths[name])
+        blank = df[time_col].isna() | (df[time_col].astype(str).str.strip() == '')
+        dated = df[time_col].apply(lambda x: reference_parse_time_to_date(x, operating_start_hour)).notna()
+        prepared[name] = os.path.join(workdir, f'{name}.dated.csv')
+        df[blank | dated].to_csv(prepared[name], index=False)
+    return prepared
+
+
+def run_chunked(paths, view_type, operating_start_hour, workdir):
+    """A date range wider than any generated date forces chunked, vectorized date filtering"""
+    previous = app_module.CSV_CHUNK_ROWS
+    app_module.CSV_CHUNK_ROWS = 37
+    try:
+        return run_app(paths, view_type, operating_start_hour, date(1900, 1, 1), date(2999, 12, 31))
+    finally:
+        app_module.CSV_CHUNK_ROWS = previous
+
+
+def run_multi_file(paths, view_type, operating_start_hour, workdir):
+    """Split each input into three files of one upload field"""
+    split = {}
+    for name, path in paths.items():
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        parts = []
+        # Keep online orders whole so the Created Time back-fill sees every line of an order
+        bounds = [0, len(df) // 3, 2 * len(df) // 3, len(df)]
+        if name == 'online' and 'OrderId' in df.columns:
+            for i in (1, 2):
+                while 0 < bounds[i] < len(df) and df['OrderId'].iloc[bounds[i]] == df['OrderId'].iloc[bounds[i] - 1]:
+                    bounds[i] += 1
+        for i in range(3):
+            part_path = os.path.join(workdir, f'{name}.part{i}.csv')
+            df.iloc[bounds[i]:max(bounds[i], bounds[i + 1])].to_csv(part_path, index=False)
+            parts.append(part_path)
+        split[name] = parts
+    return run_app(split, view_type, operating_start_hour)
+
+
+def check_timestamps(paths, operating_start_hour):
+    """Compare app.py's row parsers and vectorized timestamp parsing with the oracle, value by value"""
+    values = pd.concat([pd.read_csv(paths['online'])['Created Time'], pd.read_csv(paths['offline'])['Time']],
+                       ignore_index=True)
+    problems = []
+    for value in values:
+        for name, current, reference in [
+            ('parse_time_to_hour', app_module.parse_time_to_hour(value), reference_parse_time_to_hour(value)),
+            ('parse_time_to_date', app_module.parse_time_to_date(value, operating_start_hour),
+             reference_parse_time_to_date(value, operating_start_hour)),
+        ]:
+            if not same_value(current, reference, exact=True):
+                problems.append(f'{name}({value!r}) = {current!r}, oracle {reference!r}')
+
+    dates, hours = app_module.timestamp_values(values, operating_start_hour)
+    for value, fast_date, fast_hour in zip(values, dates, hours):
+        if not same_value(fast_date, reference_parse_time_to_date(value, operating_start_hour), exact=True):
+            problems.append(f'timestamp_values({value!r}) date = {fast_date!r}, oracle {reference_parse_time_to_date(value, operating_start_hour)!r}')
+        if not same_value(fast_hour, reference_parse_time_to_hour(value), exact=True):
+            problems.append(f'timestamp_values({value!r}) hour = {fast_hour!r}, oracle {reference_parse_time_to_hour(value)!r}')
+
+    vectorized = app_module.business_dates_vectorized(values, operating_start_hour)
+    for value, fast in zip(values, vectorized):
+        if pd.isna(fast):
+            continue  # Unmatched values go through the per-row parser, checked above
+        reference = reference_parse_time_to_date(value, operating_start_hour)
+        if reference != fast.date():
+            problems.append(f'business_dates_vectorized({value!r}) = {fast.date()}, oracle {reference!r}')
+    return problems
+
+
+def run_split_orders(paths, view_type, operating_start_hour, workdir):
+    """Split the online input into files cut inside orders, right before a line whose Created Time needs the back-fill"""
+    df = pd.read_csv(paths['online'], dtype=str, keep_default_na=False)
+    bounds = [0, len(df) // 3, 2 * len(df) // 3, len(df)]
+    if 'OrderId' in df.columns:
+        for i in (1, 2):
+            while 0 < bounds[i] < len(df) and not (df['OrderId'].iloc[bounds[i]] != '' and
+                                                  df['OrderId'].iloc[bounds[i]] == df['OrderId'].iloc[bounds[i] - 1] and
+                                                  df['Created Time'].iloc[bounds[i]] == ''):
+                bounds[i] += 1
+    parts = []
+    for i in range(3):
+        part_path = os.path.join(workdir, f'online.orders{i}.csv')
+        df.iloc[bounds[i]:max(bounds[i], bounds[i + 1])].to_csv(part_path, index=False)
+        parts.append(part_path)
+    return run_app(dict(paths, online=parts), view_type, operating_start_hour)
+
+
+def repeated_rows(paths, operating_start_hour, workdir):
+    """Oracle input for the dedupe candidate: every seventh online/offline row appears twice in a row"""
+    prepared = dict(paths)
+    for name in ['online', 'offline']:
+        df = pd.read_csv(paths[name], dtype=str, keep_default_na=False)
+        prepared[name] = os.path.join(workdir, f'{name}.repeated.csv')
+        df.iloc[sorted(list(range(len(df))) + list(range(0, len(df), 7)))].to_csv(prepared[name], index=False)
+    return prepared
+
+
+def run_dedupe(paths, view_type, operating_start_hour, workdir):
+    """
+    Upload every online/offline file twice with duplicate removal on, a fresh index per call as in the app.
+
+    The second upload repeats some lines once more (see repeated_rows): those
+    extra copies are new sales and must be kept, the rest of it must vanish.
+    """
+    repeated = repeated_rows(paths, operating_start_hour, workdir)
+    reports = {'report': report_path(paths, view_type), 'report_products': report_path(paths, view_type, True)}
+    results = {}
+    for name, process in [('online', app_module.process_online_csv), ('offline', app_module.process_offline_csv),
+                          ('online_products', app_module.process_online_csv_for_products),
+                          ('offline_products', app_module.process_offline_csv_for_products)]:
+        channel = name.split('_')[0]
+        hash_index = app_module.TransactionHashIndex(channel)
+        results[name] = process([paths[channel], repeated[channel]], view_type, operating_start_hour, hash_index=hash_index)
+        if hash_index.removed != len(pd.read_csv(paths[channel])):
+            raise AssertionError(f'{name}: {hash_index.removed} row(s) dropped as duplicates, expected every line of the first upload')
+    results['report'] = app_module.process_report_csv(reports['report'], view_type, operating_start_hour)
+    results['report_products'] = app_module.process_report_csv_for_products(reports['report_products'], view_type)
+    return results
+
+
+def xlsx_value(text):
+    """Cell value for one CSV field: numbers as numbers when they print back the same, blanks empty, the rest text"""
+    if text == '':
+        return None
+    for kind in (int, float):
+        try:
+            value = kind(text)
+        except ValueError:
+            continue
+        if str(value) == text:
+            return value
+    return text
+
+
+def run_xlsx(paths, view_type, operating_start_hour, workdir):
+    """Convert every input to a one-sheet .xlsx workbook"""
+    converted = {}
+    for name, path in paths.items():
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+        workbook = app_module.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(list(df.columns))
+        for row in df.itertuples(index=False):
+            sheet.append([xlsx_value(text) for text in row])
+        converted[name] = os.path.join(workdir, f'{name}.xlsx')
+        workbook.save(converted[name])
+    return run_app(converted, view_type, operating_start_hour)
+
+
+CANDIDATES = {
+    'current': run_current,
+    'pyarrow': run_pyarrow,
+    'chunked': run_chunked,
+    'multi-file': run_multi_file,
+    'split-orders': run_split_orders,
+    'dedupe': run_dedupe,
+    'xlsx': run_xlsx,
+}
+ROW_CHECKS = {
+    'timestamps': check_timestamps,
+}
+INEXACT_CANDIDATES = {'multi-file', 'split-orders', 'dedupe'}
+# Candidates whose oracle runs on adjusted inputs (same semantics, different input set)
+ORACLE_INPUTS = {
+    'chunked': dated_rows_only,
+    'dedupe': repeated_rows,
+}
+
+
+def normalize_key(key):
+    """Hours come back as int or float depending on NaN handling; dates as date or Timestamp"""
+    if isinstance(key, tuple):
+        return tuple(normalize_key(part) for part in key)
+    if isinstance(key, pd.Timestamp):
+        return key.date()
+    if isinstance(key, float) and key.is_integer():
+        return int(key)
+    return key
+
+
+def same_value(a, b, exact):
+    if a is None or b is None or (isinstance(a, float) and math.isnan(a)) or (isinstance(b, float) and math.isnan(b)):
+        return (a is None or (isinstance(a, float) and math.isnan(a))) and (b is None or (isinstance(b, float) and math.isnan(b)))
+    if exact:
+        return a == b
+    return math.isclose(float(a), float(b), rel_tol=1e-9, abs_tol=1e-9)
+
+
+def as_records(result):
+    """Turn a series, date x hour matrix or product frame into a sorted list of (key, value) pairs"""
+    if isinstance(result, pd.DataFrame) and 'Item' not in result.columns:
+        result = result.stack()  # Date x hour matrix: one (date, hour) entry per cell
+    if isinstance(result, pd.Series):
+        if isinstance(result.index, pd.MultiIndex):
+            result = result[result != 0]  # The matrix fills hours without sales with zeros
+        return sorted((normalize_key(k), float(v)) for k, v in result.items())
+    keys = ['Date', 'Hour', 'Item'] if 'Hour' in result.columns else ['Date', 'Item']
+    return sorted((normalize_key(tuple(row[:-1])), float(row[-1])) for row in result[keys + ['Quantity']].itertuples(index=False))
+
+
+def compare(name, expected, actual, exact):
+    """Return a description of the first difference between two results, or None"""
+    expected, actual = as_records(expected), as_records(actual)
+    if len(expected) != len(actual):
+        missing = sorted(set(k for k, _ in expected) ^ set(k for k, _ in actual), key=str)[:5]
+        return f'{name}: {len(actual)} buckets, oracle has {len(expected)} (differing keys e.g. {missing})'
+    for (key_e, value_e), (key_a, value_a) in zip(expected, actual):
+        if key_e != key_a:
+            return f'{name}: bucket {key_a!r}, oracle {key_e!r}'
+        if not same_value(value_a, value_e, exact):
+            return f'{name}: {key_a!r} = {value_a!r}, oracle {value_e!r}'
+    return None
+
+
+def run(seeds, rows, candidates, keep=False, verbose=False):
+    failures = []
+    workdir = tempfile.mkdtemp(prefix='equivalence-')
+    try:
+        for seed in range(seeds):
+            operating_start_hour = OPERATING_HOURS[seed % len(OPERATING_HOURS)]
+            case_dir = os.path.join(workdir, f'seed{seed}')
+            os.makedirs(case_dir)
+            paths = generate_case(case_dir, seed, rows, operating_start_hour)
+            oracle_results = {}
+            quiet = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+            with quiet:
+                for candidate in candidates:
+                    if candidate in ROW_CHECKS:
+                        failures.extend(f'seed {seed} {candidate}: {p}' for p in ROW_CHECKS[candidate](paths, operating_start_hour))
+                        continue
+                    oracle_paths = paths
+                    if candidate in ORACLE_INPUTS:
+                        oracle_paths = ORACLE_INPUTS[candidate](paths, operating_start_hour, case_dir)
+                    for view_type in VIEW_TYPES:
+                        key = (tuple(sorted(oracle_paths.items())), view_type)
+                        if key not in oracle_results:
+                            oracle_results[key] = run_oracle(oracle_paths, view_type, operating_start_hour)
+                        expected = oracle_results[key]
+                        actual = CANDIDATES[candidate](paths, view_type, operating_start_hour, case_dir)
+                        for name in expected:
+                            problem = compare(name, expected[name], actual[name], candidate not in INEXACT_CANDIDATES)
+                            if problem:
+                                failures.append(f'seed {seed} {view_type} start {operating_start_hour:02d}:00 {candidate}: {problem}')
+            print(f'seed {seed}: {len(failures)} failure(s) so far')
+    finally:
+        if keep or failures:
+            print(f'Inputs kept in {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seeds', type=int, default=10, help='number of random cases (default 10)')
+    parser.add_argument('--rows', type=int, default=300, help='rows per online/offline file (default 300)')
+    parser.add_argument('--candidates', default=','.join(list(CANDIDATES) + list(ROW_CHECKS)),
+                        help='comma separated engines to check against the oracle')
+    parser.add_argument('--keep', action='store_true', help='keep the generated inputs')
+    parser.add_argument('--verbose', action='store_true', help="show app.py's debug output")
+    args = parser.parse_args()
+
+    candidates = [c.strip() for c in args.candidates.split(',') if c.strip()]
+    unknown = [c for c in candidates if c not in CANDIDATES and c not in ROW_CHECKS]
+    if unknown:
+        parser.error(f'unknown candidate(s): {", ".join(unknown)}')
+    if 'pyarrow' in candidates and app_module.pa_csv is None:
+        print('pyarrow is not installed - skipping the pyarrow candidate')
+        candidates.remove('pyarrow')
+    if 'xlsx' in candidates and app_module.Workbook is None:
+        print('openpyxl is not installed - skipping the xlsx candidate')
+        candidates.remove('xlsx')
+
+    if not args.verbose:
+        warnings.simplefilter('ignore')  # The oracle keeps the original (now deprecated) pandas calls
+    failures = run(args.seeds, args.rows, candidates, args.keep, args.verbose)
+    for failure in failures[:50]:
+        print(f'❌ {failure}')
+    if failures:
+        print(f'{len(failures)} difference(s) from the oracle')
+        sys.exit(1)
+    print(f'✅ {", ".join(candidates)} match the oracle on {args.seeds} case(s)')
+
+
+if __name__ == '__main__':
+    main()
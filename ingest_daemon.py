@@ -0,0 +1,111 @@
+"""
+Watch-folder ingest service for online, offline and report exports.
+
+Polls a drop folder for new CSV or XLSX files, tells each one apart by its header
+(online, offline, sales report or product report), parses it once with the
+same rules as the upload forms and stores per-file aggregates under the ingest
+store. /salesovertime/ingested and /product/ingested then roll those up for
+any view, operating start hour and date range without parsing anything.
+
+Files are remembered by content hash, so a restart or a copy of an already
+ingested file costs one hash at most. Only one service runs per store.
+
+Example:
+    python ingest_daemon.py --watch drop --store ingested --interval 10
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import time
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+import app as report_app
+
+stopping = False
+
+
+def stop(signum, frame):
+    global stopping
+    stopping = True
+
+
+def ready_files(folder, settle_seconds):
+    """CSV/XLSX files in folder that have not been written to for settle_seconds, oldest first"""
+    now = time.time()
+    paths = []
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if name.startswith('.') or not report_app.allowed_file(name) or not os.path.isfile(path):
+            continue
+        if now - os.path.getmtime(path) >= settle_seconds:
+            paths.append(path)
+    return sorted(paths, key=os.path.getmtime)
+
+
+def scan(folder, settle_seconds):
+    """Ingest every ready file of folder once; returns how many were new"""
+    manifest = report_app.load_ingest_manifest()
+    before = json.dumps(manifest, sort_keys=True)
+    known = len(manifest['files'])
+    for path in ready_files(folder, settle_seconds):
+        if stopping:
+            break
+        try:
+            report_app.ingest_file(path, manifest)
+        except OSError as e:
+            # Moved or deleted while we looked at it; picked up again on the next scan if it comes back
+            print(f"⚠️ {path}: {e}")
+
+    # Forget paths that are gone; their contents stay ingested under their hash
+    manifest['paths'] = {path: entry for path, entry in manifest['paths'].items() if os.path.exists(path)}
+    # Rewritten only on change: every write makes the web workers reload the aggregates
+    if json.dumps(manifest, sort_keys=True) != before or not os.path.exists(report_app.ingest_store_path('manifest.json')):
+        report_app.save_ingest_manifest(manifest)
+    return len(manifest['files']) - known
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--watch', default='drop', help='folder to watch for new CSV/XLSX files')
+    parser.add_argument('--store', default=report_app.app.config['INGEST_STORE_DIR'],
+                        help='where the manifest and aggregates are kept (INGEST_STORE_DIR of the web app)')
+    parser.add_argument('--interval', type=float, default=10, help='seconds between scans')
+    parser.add_argument('--settle-seconds', type=float, default=5,
+                        help='skip files modified more recently than this (still being copied)')
+    parser.add_argument('--once', action='store_true', help='scan once and exit')
+    args = parser.parse_args()
+
+    report_app.app.config['INGEST_STORE_DIR'] = args.store
+    os.makedirs(args.watch, exist_ok=True)
+    os.makedirs(args.store, exist_ok=True)
+
+    lock_file = open(os.path.join(args.store, 'daemon.lock'), 'w')
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            sys.exit(f"Another ingest service is already using {args.store}")
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"Watching {args.watch} every {args.interval}s, storing into {args.store}")
+    while not stopping:
+        new_files = scan(args.watch, args.settle_seconds)
+        if new_files:
+            print(f"📥 Recorded {new_files} new file(s)")
+        if args.once:
+            break
+        deadline = time.time() + args.interval
+        while not stopping and time.time() < deadline:
+            time.sleep(0.5)
+
+
+if __name__ == '__main__':
+    main()
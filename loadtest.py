@@ -0,0 +1,306 @@
+"""
+Concurrent upload load test for the gunicorn deployment.
+
+Starts the app under gunicorn with the chosen worker settings, generates
+online/offline/report CSVs of the requested size, and fires concurrent
+multipart uploads at /salesovertime and /product. Prints throughput,
+p50/p95/p99 latency, error rates and worker RSS so the deployment can be
+sized from data.
+
+Example:
+    python loadtest.py --workers 4 --threads 2 --concurrency 10 --rows 50000 --requests 100
+"""
+import argparse
+import csv
+import math
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+ROUTES = ['/salesovertime', '/product']
+MAX_UPLOAD_BYTES = 16 * 1024 * 1024  # app.config['MAX_CONTENT_LENGTH']; larger uploads get a 413
+
+ITEMS = ['Latte', 'Mocha', 'Americano', 'Bagel', 'Croissant', 'Tea', 'Muffin', 'Service Charge']
+ONLINE_STATUSES = ['Completed', 'Completed', 'Completed', 'Pending Store Acceptance', 'Cancelled', 'Pending Payment']
+
+
+def generate_csvs(directory, rows, days=7, seed=0):
+    """Write online.csv, offline.csv, report.csv and product_report.csv with roughly `rows` lines each"""
+    rng = random.Random(seed)
+    start = datetime(2025, 8, 1)
+    minutes = days * 24 * 60
+    paths = {name: os.path.join(directory, f'{name}.csv') for name in ['online', 'offline', 'report', 'product_report']}
+
+    with open(paths['online'], 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['OrderId', 'Created Time', 'Status', 'Item', 'Quantity', 'Total'])
+        for i in range(rows):
+            created = start + timedelta(minutes=rng.randrange(minutes))
+            writer.writerow([f'O{i // 2}', created.strftime('%m/%d/%Y %H:%M'), rng.choice(ONLINE_STATUSES),
+                             rng.choice(ITEMS[:-1]), rng.randint(1, 3), round(rng.uniform(2, 40), 2)])
+
+    with open(paths['offline'], 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Receipt', 'Time', 'Transaction Type', 'Is_Cancelled', 'Item', 'Quantity', 'Total'])
+        for i in range(rows):
+            created = start + timedelta(minutes=rng.randrange(minutes))
+            writer.writerow([f'R{i}', created.strftime('%m/%d/%Y %H:%M'), rng.choice(['Sale', 'Sale', 'Sale', 'Return']),
+                             rng.choice(['FALSE', 'FALSE', 'TRUE']), rng.choice(ITEMS), rng.randint(1, 3),
+                             round(rng.uniform(2, 40), 2)])
+
+    with open(paths['report'], 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Date / Time', 'Total Sales'])
+        for d in range(days):
+            writer.writerow([(start + timedelta(days=d)).strftime('%d %b %Y (%a)'), round(rng.uniform(1000, 5000), 2)])
+
+    with open(paths['product_report'], 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Date / Time', 'Product Name', 'Total Items Sold'])
+        for d in range(days):
+            for item in ITEMS[:-1]:
+                writer.writerow([(start + timedelta(days=d)).strftime('%d %b %Y (%a)'), item, rng.randint(10, 200)])
+
+    return paths
+
+
+def build_multipart(fields, files):
+    """Encode form fields and (field, path) files as multipart/form-data"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, path in files.items():
+        with open(path, 'rb') as f:
+            content = f.read()
+        header = (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                  f'filename="{os.path.basename(path)}"\r\nContent-Type: text/csv\r\n\r\n')
+        parts.append(header.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def start_gunicorn(port, workers, threads, worker_class, timeout):
+    """Start `gunicorn app:app` in the repository directory and wait until it answers"""
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:app',
+           '--bind', f'127.0.0.1:{port}',
+           '--workers', str(workers),
+           '--threads', str(threads),
+           '--worker-class', worker_class,
+           '--timeout', str(timeout)]
+    try:
+        urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=2)
+        raise RuntimeError(f"something is already listening on port {port}")
+    except urllib.error.HTTPError:
+        raise RuntimeError(f"something is already listening on port {port}")
+    except OSError:
+        pass
+
+    print(f"Starting: {' '.join(cmd[2:])}")
+    proc = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.abspath(__file__)),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {proc.returncode}")
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=5)
+            return proc
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("gunicorn did not start within 60 seconds")
+
+
+def worker_pids(master_pid):
+    """PIDs of the gunicorn workers (children of the master), read from /proc"""
+    pids = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                fields = f.read().rsplit(')', 1)[1].split()
+            if int(fields[1]) == master_pid:
+                pids.append(int(entry))
+        except (OSError, IndexError, ValueError):
+            continue
+    return pids
+
+
+def rss_mb(pid):
+    """Resident set size of a process in MB (None if unavailable)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class RSSSampler(threading.Thread):
+    """Background sampler recording the peak RSS of each gunicorn worker"""
+
+    def __init__(self, master_pid, interval=0.2):
+        super().__init__(daemon=True)
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peak = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        if not os.path.isdir('/proc'):
+            return
+        while not self.stopped.is_set():
+            for pid in worker_pids(self.master_pid):
+                rss = rss_mb(pid)
+                if rss is not None:
+                    self.peak[pid] = max(self.peak.get(pid, 0.0), rss)
+            self.stopped.wait(self.interval)
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def send_upload(url, body, content_type, timeout):
+    """POST one upload and return (latency seconds, status code or error name)"""
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': content_type}, method='POST')
+    start = time.perf_counter()
+    try:
+        # Redirects mean the app flashed an error; do not follow them
+        opener = urllib.request.build_opener(NoRedirect)
+        with opener.open(req, timeout=timeout) as resp:
+            resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception as e:
+        status = type(e).__name__
+    return time.perf_counter() - start, status
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def run_load(port, payloads, total_requests, concurrency, timeout):
+    """Send total_requests uploads, cycling through payloads, with `concurrency` in flight"""
+    results = []
+
+    def task(i):
+        route, body, content_type = payloads[i % len(payloads)]
+        latency, status = send_upload(f'http://127.0.0.1:{port}{route}', body, content_type, timeout)
+        return route, latency, status
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for result in pool.map(task, range(total_requests)):
+            results.append(result)
+    return results, time.perf_counter() - start
+
+
+def print_report(results, elapsed, peak_rss):
+    """Print per-route and overall throughput, latency percentiles and error rate (413s counted apart)"""
+    print()
+    print(f"{'route':<16}{'reqs':>6}{'ok':>6}{'413':>6}{'err%':>8}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route in ROUTES + ['ALL']:
+        rows = [r for r in results if route == 'ALL' or r[0] == route]
+        if not rows:
+            continue
+        latencies = [r[1] * 1000 for r in rows]
+        ok = sum(1 for r in rows if r[2] == 200)
+        too_large = sum(1 for r in rows if r[2] == 413)
+        # Uploads over the size limit are rejected by design, not failures of the app
+        error_rate = 100.0 * (len(rows) - ok - too_large) / max(1, len(rows) - too_large)
+        print(f"{route:<16}{len(rows):>6}{ok:>6}{too_large:>6}{error_rate:>8.1f}{len(rows) / elapsed:>8.2f}"
+              f"{percentile(latencies, 50):>10.0f}{percentile(latencies, 95):>10.0f}{percentile(latencies, 99):>10.0f}")
+
+    errors = {}
+    for r in results:
+        if r[2] not in (200, 413):
+            errors[r[2]] = errors.get(r[2], 0) + 1
+    if errors:
+        print(f"Errors by status: {errors}")
+
+    print(f"Wall time: {elapsed:.2f}s")
+    if peak_rss:
+        values = list(peak_rss.values())
+        print(f"Worker peak RSS (MB): max {max(values):.0f}, mean {sum(values) / len(values):.0f}, "
+              f"total {sum(values):.0f} across {len(values)} worker(s)")
+    else:
+        print("Worker peak RSS: unavailable (needs /proc)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn --workers (default 1, as in the Procfile)')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn --threads')
+    parser.add_argument('--worker-class', default='sync', help='gunicorn --worker-class (sync, gthread, ...)')
+    parser.add_argument('--timeout', type=int, default=30, help='gunicorn worker timeout in seconds')
+    parser.add_argument('--rows', type=int, default=10000, help='rows per generated online/offline CSV')
+    parser.add_argument('--concurrency', type=int, default=10, help='uploads in flight at once')
+    parser.add_argument('--requests', type=int, default=50, help='total uploads to send')
+    parser.add_argument('--routes', default=','.join(ROUTES), help='comma separated routes to hit')
+    parser.add_argument('--view-type', default='daily', choices=['daily', 'hourly'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Generating CSVs with {args.rows} rows...")
+        paths = generate_csvs(directory, args.rows)
+        sizes = ', '.join(f"{name} {os.path.getsize(path) / 1024 / 1024:.1f} MB" for name, path in paths.items())
+        print(f"Generated: {sizes}")
+
+        fields = {'view_type': args.view_type, 'operating_hours': '00:00'}
+        payloads = []
+        for route in args.routes.split(','):
+            report = paths['report'] if route == '/salesovertime' else paths['product_report']
+            body, content_type = build_multipart(fields, {
+                'online_csv': paths['online'],
+                'offline_csv': paths['offline'],
+                'report_csv': report,
+            })
+            if len(body) > MAX_UPLOAD_BYTES:
+                print(f"⚠️ {route} upload is {len(body) / 1024 / 1024:.1f} MB, over the 16 MB limit - expect 413s; lower --rows")
+            payloads.append((route, body, content_type))
+
+        proc = start_gunicorn(args.port, args.workers, args.threads, args.worker_class, args.timeout)
+        sampler = RSSSampler(proc.pid)
+        sampler.start()
+        try:
+            print(f"Sending {args.requests} uploads with concurrency {args.concurrency}...")
+            results, elapsed = run_load(args.port, payloads, args.requests, args.concurrency, args.timeout + 30)
+        finally:
+            sampler.stop()
+            proc.send_signal(signal.SIGTERM)
+            proc.wait(timeout=30)
+
+        print_report(results, elapsed, sampler.peak)
+
+
+if __name__ == '__main__':
+    main()